@@ -1,37 +1,87 @@
 from google.adk.agents import Agent
-from google.adk.runners import InMemoryRunner
-from my_tools import track_price, extract_main_file, save_search
+from my_tools import track_price, track_prices, plan_price_batches, extract_main_file, save_search
 import asyncio
 from google.genai import types
 from google.adk.models.google_llm import Gemini
-from my_tools import file_to_analyze
+from my_tools import file_to_analyze, run_market_analysis, load_verdict, VERDICT_STATE_KEY
 from google.adk.agents import SequentialAgent
+import os
+from events import emit, current_job
+from checkpoint import checkpoints, current_run, new_run_id
+from sharding import run_sharded_analysis
+from metrics import AGENT_TURN_SECONDS, LLM_TOKENS, observe_job, registry
+from runners import RunnerPool, ensure_session
+from resilience import AdaptiveRateLimiter, Upstream
+from jobs import run_in_thread
+from analyst import ANALYST_MODE, ANALYST_MODEL, StubAnalystModel, GeminiTextModel, write_sectioned_report
+import argparse
+import time
 
 GEMINI_MODEL = "gemini-2.5-flash"
-retry_config = types.HttpRetryOptions(
-    attempts=5,  # Maximum retry attempts
-    exp_base=7,  # Delay multiplier
-    initial_delay=1,
-    http_status_codes=[429, 500, 503, 504],  # Retry on these HTTP errors
-)
+# "native" computes the market table in Python and only uses Gemini for the analyst report,
+# "llm" keeps the original flow where the search agent does the maths
+PRICING_MODE = os.getenv("PRICING_MODE", "native")
+INCREMENTAL_PRICING = os.getenv("PRICING_INCREMENTAL", "0") == "1"
+# Above 1, the pricing stage is split across this many worker processes (see sharding.py)
+PRICING_SHARDS = int(os.getenv("PRICING_SHARDS", "1"))
+# Requests per second to Gemini; 0 starts unlimited and settles on the quota after the first 429
+GEMINI_RATE_PER_SEC = float(os.getenv("GEMINI_RATE_PER_SEC", "0"))
+# Retries are done by ResilientGemini below, under a total time budget, instead of the client's
+# own exponential backoff (which could sleep for minutes)
+retry_config = types.HttpRetryOptions(attempts=1)
+gemini_upstream = Upstream("gemini", AdaptiveRateLimiter("gemini", GEMINI_RATE_PER_SEC))
+
+
+class ResilientGemini(Gemini):
+    """Gemini behind the shared adaptive limiter, jittered retry budget and circuit breaker."""
+    async def generate_content_async(self, llm_request, stream: bool = False):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            probe = gemini_upstream.breaker.before()
+            yielded = False
+            try:
+                await gemini_upstream.limiter.acquire_async()
+                async for response in super().generate_content_async(llm_request, stream):
+                    yielded = True
+                    yield response
+            except Exception as e:
+                delay = gemini_upstream.failed(e, attempt, started)
+                # A stream that already produced output can't be replayed
+                if delay is None or yielded:
+                    raise
+            else:
+                gemini_upstream.succeeded()
+                return
+            finally:
+                # Cancellation or a closed generator ends the attempt without an outcome
+                gemini_upstream.breaker.release_probe(probe)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+# One model object shared by both agents, so its client and HTTP connections are reused
+gemini = ResilientGemini(model=GEMINI_MODEL, retry_options = retry_config)
 search_agent = Agent(
-    model = Gemini(model=GEMINI_MODEL, retry_options = retry_config),
+    model = gemini,
     name = "search_assistant",
     instruction="""You are a granular Market Research Orchestrator. Follow this strict execution plan:
 
     PHASE 1: INVENTORY LOADING
     1. Call 'extract_main_file' (file: 'book.xlsx') to get the list of products and their internal costs.
 
-    PHASE 2: MARKET DISCOVERY (CRITICAL: ITERATION REQUIRED)
-    2. You must now loop through EVERY single product found in Phase 1. 
-       - For EACH product, call the 'track_price' tool individually.
-       - You must wait for the tool to return the list of competitor prices for that specific product.
-       - DO NOT skip any products. If there are 5 products, you must call 'track_price' 5 times.
+    PHASE 2: MARKET DISCOVERY
+    2. Call 'plan_price_batches' with the full list of product names found in Phase 1.
+       - Then call 'track_prices' once per batch. Each call fetches the batch concurrently and returns results keyed by product name.
+       - If a response lists products under "pending", call 'track_prices' again with exactly those products.
+       - DO NOT skip any products. Only call 'track_price' individually to retry a product that came back with an error.
 
     PHASE 3: DATA REFINEMENT & CALCULATION
     3. For EACH product's specific search results:
-       - Filter out outliers (refurbished/EMI/illogical prices).
-       - Calculate the 'Market Average' strictly based on the NEW data fetched from 'track_price'. 
+       - With the "summary" encoding the tool has already filtered outliers; use its "avg" as the Market Average,
+         "max_reviews" as the maximum number of reviews and "avg_rating" as the average rating.
+       - Otherwise filter out outliers (refurbished/EMI/illogical prices) and calculate the 'Market Average' strictly
+         based on the NEW data fetched from 'track_prices'.
        - DO NOT average the prices from the original Excel file.
        - DO NOT calculate one global average for all products; I need one average PER product.
 
@@ -49,12 +99,12 @@ search_agent = Agent(
     - Ignore rows with non-numerical prices in the source file.
     - Remove commas from numbers before processing.
         """,
-    tools=[extract_main_file, track_price, save_search]
+    tools=[extract_main_file, plan_price_batches, track_prices, track_price, save_search]
 )
 
 analyst_agent = Agent(
     name="analyst",
-    model= GEMINI_MODEL,
+    model= gemini,
     instruction = """ You are an expert analyst for a retail electronic store, use the file_to_analyze tools to retrieve data and repond with a breif report on each
     listed product, make suggestions to the retail store, for example if the market price of a product is lower than the listed price of the retail store, suggest the store to increase their \
     listed price, also look into the ratings to know if the product is good and the number of reviews to get to know the demand of the product""",
@@ -67,27 +117,111 @@ root_agent = SequentialAgent(
     description = "Manages the execution of the sub agents"
 )
 
-async def main_async():
-    session_id = "session-1"
-    user_id = "user-1"
-    app_name = "price-tracker"
-    runner = InMemoryRunner(agent=root_agent, app_name=app_name)
+# Writes the analyst report in parallel sections when ANALYST_MODE=sections (native pricing only)
+section_model = StubAnalystModel() if ANALYST_MODEL == "stub" else GeminiTextModel(gemini)
+
+# Built once and reused by every run; the backend warms them at startup
+analyst_runners = RunnerPool(analyst_agent)
+pipeline_runners = RunnerPool(root_agent)
+
+
+def warm_runners():
+    """Builds the runner pools and the model client ahead of the first request."""
+    pool = analyst_runners if PRICING_MODE == "native" else pipeline_runners
+    pool.warm()
+    if ANALYST_MODEL == "stub":
+        return
+    try:
+        gemini.api_client
+    except Exception as e:
+        print(f"[ERROR] Could not create the Gemini client: {e}")
+
+
+async def main_async(file_name: str = "book.xlsx", run_id: str | None = None, resume: bool = False,
+                     user_id: str = "local"):
+    """
+    Runs the pipeline under a checkpointed run id. With resume=True the run picks up from its
+    last finished phase: saved fetches aren't repeated and a saved verdict isn't recomputed.
+    The agent session is stored under (user_id, run_id).
+    """
+    run_id = run_id or current_job.get() or new_run_id()
+    state = checkpoints.get(run_id)
+    if resume:
+        if state is None:
+            print(f"[ERROR] No checkpoint found for run {run_id}")
+            emit("error", message=f"No checkpoint found for run {run_id}")
+            return None
+        file_name = state["file_name"] or file_name
+        print(f"[INFO] Resuming run {run_id} from phase '{state['phase']}' ({state['products_fetched']} products fetched)")
+        if state["phase"] == "done":
+            emit("progress", phase="done", progress=100)
+            emit("report_ready", report=state["outputs"].get("done"), timings={})
+            return state["outputs"].get("done")
+    else:
+        print(f"[INFO] Run id: {run_id} (resume with --resume {run_id})")
+    checkpoints.start(run_id, file_name)
+    # Each run executes in its own task (or asyncio.run), so the value doesn't leak between runs
+    current_run.set(run_id)
+    if PRICING_MODE == "native":
+        if resume and "saved" in state["outputs"]:
+            print("--- Verdict already saved, skipping pricing stage ---")
+        else:
+            print("--- Running deterministic pricing stage ---")
+            if PRICING_SHARDS > 1:
+                if INCREMENTAL_PRICING:
+                    print("[INFO] PRICING_INCREMENTAL has no effect with PRICING_SHARDS > 1, every product is re-priced")
+                if resume:
+                    print("[INFO] Sharded runs don't checkpoint per product, resuming re-prices every shard")
+                result = await run_in_thread(run_sharded_analysis, file_name, PRICING_SHARDS)
+            else:
+                result = await run_in_thread(run_market_analysis, file_name, incremental=INCREMENTAL_PRICING)
+            print(f"[pricing]: {result['message']}")
+            if result["status"] != "Success":
+                emit("error", message=result["message"])
+                return None
+            checkpoints.set_phase(run_id, "saved", result)
+        if ANALYST_MODE == "sections":
+            return await _run_sections(run_id)
+        pool = analyst_runners
+    else:
+        if ANALYST_MODE == "sections":
+            print("[INFO] ANALYST_MODE=sections has no effect with PRICING_MODE=llm, the analyst agent writes the report")
+        pool = pipeline_runners
+    async with pool.acquire() as runner:
+        return await _run_agent(runner, run_id, user_id)
+
+
+async def _run_agent(runner, run_id: str, user_id: str):
+    session_id = run_id
     print("--- preparing Agent ---")
-    await runner.session_service.create_session(
-        session_id=session_id,
-        user_id=user_id,
-        app_name=app_name
-    )
+    checkpoints.set_phase(run_id, "analyst")
+    emit("progress", phase="analyst", progress=97)
+    # The analyst's file_to_analyze reads this run's verdict by id instead of the newest file on disk
+    await ensure_session(runner, user_id, session_id, state={VERDICT_STATE_KEY: run_id})
     query = "start the product analysis pipeline immediately"
     print(f"User Query: {query}")
     content = types.Content(role='user', parts=[types.Part(text=query)])
     print("--- Session Created ---")
     final_analysis = None
+    turn_started = time.perf_counter()
     async for event in runner.run_async(
         user_id=user_id,
         session_id=session_id,
         new_message=content
     ):
+        # Time since the previous event is the model/tool turn that produced this one
+        now = time.perf_counter()
+        AGENT_TURN_SECONDS.observe(now - turn_started, agent=event.author)
+        observe_job(f"agent:{event.author}", now - turn_started)
+        turn_started = now
+        usage = getattr(event, "usage_metadata", None)
+        if usage:
+            prompt_tokens = usage.prompt_token_count or 0
+            output_tokens = usage.candidates_token_count or 0
+            LLM_TOKENS.inc(prompt_tokens, agent=event.author, kind="prompt")
+            LLM_TOKENS.inc(output_tokens, agent=event.author, kind="output")
+            print(f"[{event.author}]: turn used {prompt_tokens} prompt + {output_tokens} output tokens")
+            emit("tokens", agent=event.author, prompt=prompt_tokens, output=output_tokens)
         if event.content and event.content.parts:
             part = event.content.parts[0]
             if part.function_call:
@@ -96,21 +230,54 @@ async def main_async():
                 product_arg = args.get('product')
                 if tool_name == "track_price":
                     print(f"[{event.author}]: Calling Tool -> {tool_name} for {product_arg}")
+                elif tool_name == "track_prices":
+                    print(f"[{event.author}]: Calling Tool -> {tool_name} for {len(args.get('products', []))} products")
                 else:
                     print(f"[{event.author}]: Calling Tool -> {tool_name}")
-        elif part.text:
-            print(f"[{event.author}]: {part.text[:100]}...")
-            
+                emit("agent_tool_call", agent=event.author, tool=tool_name)
+            elif part.text:
+                print(f"[{event.author}]: {part.text[:100]}...")
+                emit("agent_message", agent=event.author, text=part.text)
+
         # Capture the final output from the analyst
         if event.author == "analyst" and event.content:
             final_analysis = event.content.parts[0].text
 
+    return _finish_run(run_id, final_analysis)
+
+
+async def _run_sections(run_id: str):
+    print("--- Writing the analyst report in sections ---")
+    checkpoints.set_phase(run_id, "analyst")
+    emit("progress", phase="analyst", progress=97)
+    verdict = load_verdict(run_id)
+    if not verdict:
+        emit("error", message=f"No verdict found for run {run_id}")
+        return None
+    result = await write_sectioned_report(verdict, section_model)
+    if result["errors"]:
+        print(f"[ERROR] {result['errors']} of {len(result['sections'])} analyst sections failed")
+    return _finish_run(run_id, result["report"], summary=result["summary"])
+
+
+def _finish_run(run_id: str, final_analysis: str | None, **extra):
     print("\n--- FINAL REPORT ---")
     print(final_analysis)
-    #     print(event)
-    #     if event.author == "analyst" and event.content:
-    #         final_analysis = event.content.parts[0].text
-    # return final_analysis
+    # Backend jobs are timed under their job id, CLI runs under the run id
+    timings = registry.job_summary(current_job.get() or run_id)
+    if timings:
+        print("\n--- TIMINGS ---")
+        for name, timing in timings.items():
+            print(f"{name}: {timing['calls']} calls, {timing['seconds']}s")
+    checkpoints.set_phase(run_id, "done", final_analysis)
+    emit("progress", phase="done", progress=100)
+    emit("report_ready", report=final_analysis, timings=timings, **extra)
+    return final_analysis
+
 if __name__ == "__main__":
-    asyncio.run(main_async())
+    parser = argparse.ArgumentParser(description="Run the Retail Radar pricing pipeline.")
+    parser.add_argument("--file", default="book.xlsx", help="Inventory file to analyse")
+    parser.add_argument("--resume", metavar="RUN_ID", help="Continue a previous run from its last checkpoint")
+    args = parser.parse_args()
+    asyncio.run(main_async(args.file, run_id=args.resume, resume=args.resume is not None))
 
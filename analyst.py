@@ -0,0 +1,204 @@
+"""
+Sectioned analyst reports.
+
+Instead of one model turn over the whole verdict, the verdict is split into sections of a few
+products (or one brand category each), the sections are written concurrently by a bounded pool
+of workers, and every finished section is emitted as a `report_section` event straight away.
+A short summary is written last from the aggregate numbers, not from the section texts, so no
+single prompt grows with the catalog.
+
+Models only need `async generate(instruction, prompt) -> str`. GeminiTextModel wraps the shared
+ADK model; StubAnalystModel answers from the prompt's own numbers so the mode runs offline.
+"""
+import asyncio
+import json
+import time
+import os
+from events import emit
+from metrics import AGENT_TURN_SECONDS, LLM_TOKENS, observe_job
+from dotenv import load_dotenv
+load_dotenv()
+
+# "single" keeps the one-turn analyst agent, "sections" writes the report in parallel sections
+ANALYST_MODE = os.getenv("ANALYST_MODE", "single")
+CHUNK_MODES = ("product", "category")
+ANALYST_CHUNK_BY = os.getenv("ANALYST_CHUNK_BY", "product")
+# Products per section; larger categories are split into several sections
+ANALYST_CHUNK_SIZE = int(os.getenv("ANALYST_CHUNK_SIZE", "10"))
+ANALYST_WORKERS = int(os.getenv("ANALYST_WORKERS", "4"))
+# "gemini", or "stub" for offline runs and tests
+ANALYST_MODEL = os.getenv("ANALYST_MODEL", "gemini")
+ANALYST_STUB_LATENCY = float(os.getenv("ANALYST_STUB_LATENCY", "0"))
+# Over/underpriced products listed in the summary prompt
+SUMMARY_HIGHLIGHTS = 5
+
+SECTION_INSTRUCTION = """You are an expert analyst for a retail electronic store. You get the market verdict for a few
+products as JSON. Write a brief report on each product: compare the store's listed price with the market average
+and suggest raising or lowering it, use the ratings to judge whether the product is good and the number of reviews
+to judge its demand. Only use the numbers given; do not add a title or an overall summary."""
+
+SUMMARY_INSTRUCTION = """You are an expert analyst for a retail electronic store. You get aggregate numbers for the
+store's whole catalog and the products with the largest gaps to the market. Write a short executive summary
+(at most two paragraphs) with the main pricing actions for the store. Only use the numbers given."""
+
+
+def chunk_verdict(verdict: dict, by: str = ANALYST_CHUNK_BY, size: int = ANALYST_CHUNK_SIZE) -> list[tuple[str, dict]]:
+    """
+    Splits {product: verdict row} into (section title, {product: row}) chunks, in catalog order.
+    Args:
+        verdict: The run's verdict keyed by product name, as returned by load_verdict.
+        by: "product" for consecutive groups of `size` products, "category" for one brand per section.
+        size: Maximum products per section.
+    """
+    if by not in CHUNK_MODES:
+        raise ValueError(f"Unknown analyst chunk mode '{by}', expected one of {CHUNK_MODES}")
+    size = max(1, size)
+    products = list(verdict)
+    if by == "product":
+        return [(f"Products {start + 1}-{min(start + size, len(products))}",
+                 {product: verdict[product] for product in products[start:start + size]})
+                for start in range(0, len(products), size)]
+    from sharding import product_category
+    groups = {}
+    for product in products:
+        groups.setdefault(product_category(product) or "other", []).append(product)
+    chunks = []
+    for category, members in groups.items():
+        parts = [members[start:start + size] for start in range(0, len(members), size)]
+        for number, part in enumerate(parts, start=1):
+            title = category.title() if len(parts) == 1 else f"{category.title()} ({number}/{len(parts)})"
+            chunks.append((title, {product: verdict[product] for product in part}))
+    return chunks
+
+
+def section_prompt(title: str, rows: dict) -> str:
+    return json.dumps({"section": title, "products": rows}, ensure_ascii=False, default=str)
+
+
+def summary_prompt(verdict: dict, titles: list[str]) -> str:
+    """Catalog-level numbers for the summary: status counts and the largest price gaps."""
+    counts, gaps = {}, []
+    for product, row in verdict.items():
+        status = row.get("Status") or "Unknown"
+        counts[status] = counts.get(status, 0) + 1
+        listed, market = row.get("Original Listing Price"), row.get("Market Average Price")
+        if isinstance(listed, (int, float)) and isinstance(market, (int, float)) and market:
+            gaps.append((round((listed - market) / market * 100, 1), product))
+    gaps.sort()
+    return json.dumps({
+        "products": len(verdict),
+        "status_counts": counts,
+        "sections": titles,
+        "most_overpriced": [{"product": p, "gap_percent": g} for g, p in reversed(gaps[-SUMMARY_HIGHLIGHTS:]) if g > 0],
+        "most_underpriced": [{"product": p, "gap_percent": g} for g, p in gaps[:SUMMARY_HIGHLIGHTS] if g < 0],
+    }, ensure_ascii=False)
+
+
+class StubAnalystModel:
+    """
+    Offline stand-in for Gemini. Writes one deterministic line per product (or a one-paragraph
+    summary) from the numbers in the prompt; `latency` simulates a model turn.
+    """
+    name = "stub"
+
+    def __init__(self, latency: float = ANALYST_STUB_LATENCY):
+        self.latency = latency
+        self.calls = 0
+
+    async def generate(self, instruction: str, prompt: str) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        data = json.loads(prompt)
+        if "products" in data and isinstance(data["products"], dict):
+            lines = []
+            for product, row in data["products"].items():
+                listed, market = row.get("Original Listing Price"), row.get("Market Average Price")
+                if not isinstance(market, (int, float)) or not isinstance(listed, (int, float)):
+                    lines.append(f"- {product}: no usable prices, keep the current price.")
+                    continue
+                advice = "lower the price" if listed > market else "raise the price" if listed < market else "keep the price"
+                lines.append(f"- {product}: listed at {listed} vs market average {market} "
+                             f"({row.get('Status')}), {advice}. Rating {row.get('Average of all ratings')}, "
+                             f"{row.get('Maximum Number of reviews')} reviews.")
+            return "\n".join(lines)
+        counts = ", ".join(f"{count} {status.lower()}" for status, count in data["status_counts"].items())
+        over = ", ".join(item["product"] for item in data["most_overpriced"]) or "none"
+        under = ", ".join(item["product"] for item in data["most_underpriced"]) or "none"
+        return (f"{data['products']} products analysed ({counts}). Largest markups: {over}. "
+                f"Largest discounts: {under}.")
+
+
+class GeminiTextModel:
+    """One-shot text generation on an ADK model (the shared ResilientGemini), outside any agent session."""
+    name = "analyst_section"
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    async def generate(self, instruction: str, prompt: str) -> str:
+        from google.adk.models.llm_request import LlmRequest
+        from google.genai import types
+        request = LlmRequest(
+            model=self.llm.model,
+            contents=[types.Content(role="user", parts=[types.Part(text=prompt)])],
+            config=types.GenerateContentConfig(system_instruction=instruction),
+        )
+        texts = []
+        async for response in self.llm.generate_content_async(request):
+            usage = getattr(response, "usage_metadata", None)
+            if usage:
+                LLM_TOKENS.inc(usage.prompt_token_count or 0, agent=self.name, kind="prompt")
+                LLM_TOKENS.inc(usage.candidates_token_count or 0, agent=self.name, kind="output")
+            if response.content and response.content.parts:
+                texts.extend(part.text for part in response.content.parts if part.text)
+        return "".join(texts)
+
+
+async def write_sectioned_report(verdict: dict, model, by: str = ANALYST_CHUNK_BY, size: int = ANALYST_CHUNK_SIZE,
+                                 workers: int = ANALYST_WORKERS) -> dict:
+    """
+    Writes the analyst report section by section with at most `workers` model calls in flight,
+    emitting each section as soon as it is done, then the summary.
+    Returns {"report": assembled markdown, "summary": text, "sections": [...], "errors": count}.
+    A failed section is reported in its place instead of failing the whole report.
+    """
+    chunks = chunk_verdict(verdict, by, size)
+    total = len(chunks)
+    print(f"[INFO] Writing the analyst report in {total} sections with {workers} workers")
+    sections = [None] * total
+    limit = asyncio.Semaphore(max(1, workers))
+
+    async def _write(index: int, title: str, rows: dict):
+        async with limit:
+            started = time.perf_counter()
+            try:
+                text, error = await model.generate(SECTION_INSTRUCTION, section_prompt(title, rows)), None
+            except Exception as e:
+                print(f"[ERROR] Analyst section '{title}' failed: {e}")
+                text, error = None, str(e)
+            elapsed = time.perf_counter() - started
+        AGENT_TURN_SECONDS.observe(elapsed, agent="analyst_section")
+        observe_job("agent:analyst_section", elapsed)
+        section = {"index": index, "title": title, "products": list(rows), "text": text, "error": error}
+        sections[index] = section
+        emit("report_section", total=total, seconds=round(elapsed, 3), **section)
+        return section
+
+    done = 0
+    for finished in asyncio.as_completed([_write(index, title, rows) for index, (title, rows) in enumerate(chunks)]):
+        await finished
+        done += 1
+        emit("progress", phase="analyst", progress=97 + int(2 * done / max(total, 1)))
+
+    try:
+        summary = await model.generate(SUMMARY_INSTRUCTION, summary_prompt(verdict, [title for title, _ in chunks]))
+    except Exception as e:
+        print(f"[ERROR] Analyst summary failed: {e}")
+        summary = f"_Summary unavailable: {e}_"
+    parts = ["# Market Analysis", "## Summary", summary]
+    for section in sections:
+        parts.append(f"## {section['title']}")
+        parts.append(section["text"] if section["error"] is None else f"_Section failed: {section['error']}_")
+    errors = sum(section["error"] is not None for section in sections)
+    return {"report": "\n\n".join(parts), "summary": summary, "sections": sections, "errors": errors}
@@ -1,12 +1,45 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import asyncio
-from agent import main_async
-import threading
-import sys
-from io import StringIO
+from agent import main_async, warm_runners
+from jobs import JobManager, QueueFullError, DONE
+from events import bus, ALL_JOBS
+from history import price_history
+from checkpoint import checkpoints
+from monitor import Monitor, watchlist, MONITOR_ENABLED, MONITOR_JOB, DEFAULT_INTERVAL
+from metrics import registry, WS_EVENTS, WS_SEND_SECONDS
+from inventory import READERS
+from fastapi.responses import PlainTextResponse
+from dotenv import load_dotenv
+import time
+import os
+load_dotenv()
 
-app = FastAPI()
+# Client-supplied inventory names are resolved inside this folder and may not leave it
+INVENTORY_DIR = os.path.realpath(os.getenv("INVENTORY_DIR", "."))
+
+
+async def run_job(job):
+    return await main_async(**job.params)
+
+
+job_manager = JobManager(run_job)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the agent runners and model client once instead of on every request
+    warm_runners()
+    await job_manager.start()
+    monitor_task = asyncio.create_task(Monitor(watchlist).run_forever()) if MONITOR_ENABLED else None
+    yield
+    if monitor_task:
+        monitor_task.cancel()
+    await job_manager.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -17,64 +50,159 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# A client that can't take a message within this many seconds is disconnected
+SEND_TIMEOUT = 10
+
 class ConnectionManager:
+    """Pumps bus events to each websocket from its own task, so a slow browser only delays itself."""
     def __init__(self):
-        self.active_connections: list[WebSocket] = []
+        self.active_connections: dict[WebSocket, object] = {}
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, job_id: str = ALL_JOBS):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections[websocket] = bus.subscribe(job_id)
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        subscriber = self.active_connections.pop(websocket, None)
+        if subscriber is not None:
+            bus.unsubscribe(subscriber)
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+    async def pump(self, websocket: WebSocket):
+        subscriber = self.active_connections[websocket]
+        while True:
+            event = await subscriber.get()
+            if subscriber.dropped:
+                event = {**event, "dropped": subscriber.dropped}
+            started = time.perf_counter()
+            await asyncio.wait_for(websocket.send_json(event), timeout=SEND_TIMEOUT)
+            WS_SEND_SECONDS.observe(time.perf_counter() - started)
+            WS_EVENTS.inc(type=event["type"])
+
+    async def serve(self, websocket: WebSocket, job_id: str = ALL_JOBS):
+        await self.connect(websocket, job_id)
+        sender = asyncio.create_task(self.pump(websocket))
+        try:
+            while True:
+                receiver = asyncio.create_task(websocket.receive_text())
+                done, _ = await asyncio.wait({receiver, sender}, return_when=asyncio.FIRST_COMPLETED)
+                if sender in done:
+                    receiver.cancel()
+                    break
+                receiver.result()  # clients don't send commands, just drain the socket
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
+            self.disconnect(websocket)
 
 manager = ConnectionManager()
 
-@app.post("/start-analysis")
-async def start_analysis():
-    # Redirect stdout to a string buffer
-    old_stdout = sys.stdout
-    sys.stdout = redirected_output = StringIO()
 
-    # Run the analysis in a separate thread
-    thread = threading.Thread(target=asyncio.run, args=(main_async(),))
-    thread.start()
+def _get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return job
 
-    # Periodically send the output to the client
-    while thread.is_alive():
-        await asyncio.sleep(0.1)
-        output = redirected_output.getvalue()
-        if output:
-            await manager.broadcast(output)
-            redirected_output.truncate(0)
-            redirected_output.seek(0)
 
-    # Restore stdout
-    sys.stdout = old_stdout
+def _inventory_path(file_name: str) -> str:
+    """Resolves a client-supplied inventory name to a file inside INVENTORY_DIR, or raises a 4xx."""
+    parts = file_name.replace("\\", "/").split("/")
+    if not file_name or os.path.isabs(file_name) or os.path.splitdrive(file_name)[0] or ".." in parts:
+        raise HTTPException(status_code=400, detail="file_name must be a relative path inside the inventory folder")
+    if os.path.splitext(file_name)[1].lower() not in READERS:
+        raise HTTPException(status_code=400, detail=f"Unsupported inventory type, expected one of {tuple(READERS)}")
+    path = os.path.realpath(os.path.join(INVENTORY_DIR, file_name))
+    # realpath follows symlinks, so a link pointing outside the folder is caught here too
+    if os.path.commonpath([path, INVENTORY_DIR]) != INVENTORY_DIR:
+        raise HTTPException(status_code=400, detail="file_name must be a relative path inside the inventory folder")
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"Inventory '{file_name}' not found")
+    return path
 
-    # Get the final output and broadcast it
-    output = redirected_output.getvalue()
-    await manager.broadcast(output)
 
-    return {"status": "success"}
+@app.post("/start-analysis")
+async def start_analysis(file_name: str = "book.xlsx", user_id: str = "anonymous"):
+    path = _inventory_path(file_name)
+    try:
+        job = job_manager.submit(file_name=path, user_id=user_id)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"status": "success", **job.as_dict()}
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return _get_job(job_id).as_dict()
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    _get_job(job_id)
+    return job_manager.cancel(job_id).as_dict()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    _get_job(job_id)
+    return {"job_id": job_id, "events": bus.history(job_id)}
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = _get_job(job_id)
+    if job.status != DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return {"job_id": job.id, "result": job.result, "timings": registry.job_summary(job.id)}
+
+@app.get("/runs")
+async def checkpointed_runs(limit: int = 20):
+    return await asyncio.to_thread(checkpoints.runs, limit)
+
+@app.post("/runs/{run_id}/resume")
+async def resume_run(run_id: str, user_id: str = "anonymous"):
+    state = await asyncio.to_thread(checkpoints.get, run_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    try:
+        job = job_manager.submit(file_name=state["file_name"], run_id=run_id, resume=True, user_id=user_id)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"status": "success", "resumed_from": state["phase"], **job.as_dict()}
+
+@app.get("/monitor")
+async def monitor_status():
+    stats = await asyncio.to_thread(watchlist.stats)
+    return {**stats, "enabled": MONITOR_ENABLED, "alerts": bus.history(MONITOR_JOB)}
+
+@app.post("/monitor/watch")
+async def monitor_watch(product: list[str] = Query(...), interval: float = Query(DEFAULT_INTERVAL, gt=0)):
+    try:
+        count = await asyncio.to_thread(watchlist.watch, {name: None for name in product}, interval)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "watching": count, "interval": interval}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return registry.render()
+
+@app.get("/history/latest")
+async def history_latest(product: list[str] | None = Query(default=None)):
+    return await asyncio.to_thread(price_history.latest_snapshot, product)
+
+@app.get("/history/runs")
+async def history_runs(limit: int = 50):
+    return await asyncio.to_thread(price_history.runs, limit)
+
+@app.get("/history/{product}")
+async def history_product(product: str, days: float = 90):
+    return {"product": product, "days": days,
+            "history": await asyncio.to_thread(price_history.product_history, product, days)}
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
-    try:
-        while True:
-            data = await websocket.receive_text()
-            await manager.send_personal_message(f"You wrote: {data}", websocket)
-    except WebSocketDisconnect:
-        manager.disconnect(websocket)
-        await manager.broadcast("Client left the chat")
+    await manager.serve(websocket)
+
+@app.websocket("/ws/{job_id}")
+async def job_websocket_endpoint(websocket: WebSocket, job_id: str):
+    await manager.serve(websocket, job_id)
 
 if __name__ == "__main__":
     import uvicorn
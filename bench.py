@@ -0,0 +1,196 @@
+"""
+Benchmark harness for the pricing pipeline.
+
+Generates synthetic inventories, serves canned Google Shopping responses from a local
+fake SerpApi server and replaces Gemini with a deterministic stub analyst, then reports
+per-stage latency, throughput and peak RSS as JSON.
+
+    python bench.py --sizes 100,1000,10000 --output bench_output.txt
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import subprocess
+import argparse
+import threading
+import tempfile
+import hashlib
+import socket
+import asyncio
+import json
+import time
+import csv
+import sys
+import os
+
+DEFAULT_SIZES = "100,1000,10000"
+
+
+def canned_results(query: str) -> dict:
+    """Deterministic Google Shopping payload for a query: four new listings, one refurbished, one outlier."""
+    seed = int(hashlib.md5(query.encode("utf-8")).hexdigest()[:8], 16)
+    base = 1000 + seed % 90000
+    results = []
+    for i, factor in enumerate((0.95, 1.0, 1.02, 1.05, 0.7, 3.0)):
+        price = round(base * factor, 2)
+        item = {
+            "title": f"{query} listing {i}",
+            "price": f"₹{price:,.2f}",
+            "extracted_price": price,
+            "source": f"Store {(seed + i) % 12}",
+            "product_link": f"https://example.com/{seed}/{i}",
+            "rating": round(3 + ((seed >> i) % 20) / 10, 1),
+            "reviews": (seed >> i) % 5000,
+        }
+        if factor == 0.7:
+            item["second_hand_condition"] = "refurbished"
+        results.append(item)
+    return {"shopping_results": results}
+
+
+def start_fake_serpapi(port: int, latency: float = 0.0) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+            if latency:
+                time.sleep(latency)
+            body = json.dumps(canned_results(query)).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def write_inventory(path: str, size: int):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Product Name", "Cost Price"])
+        for i in range(size):
+            writer.writerow([f"Bench Phone {i} {128 * (1 + i % 4)}GB", 5000 + (i * 37) % 95000])
+
+
+def run_single(size: int, latency: float, workdir: str) -> dict:
+    """Runs one catalog size in this process. Must be called before anything imports my_tools."""
+    port = free_port()
+    os.environ.update({
+        "SERPAPI_BACKEND": f"http://127.0.0.1:{port}",
+        "SERPAPI_KEY": "bench",
+        "SERPAPI_RATE_PER_SEC": "0",
+        "PRICE_CACHE_PATH": os.path.join(workdir, "price_cache.sqlite"),
+        "SKU_STATE_PATH": os.path.join(workdir, "sku_state.sqlite"),
+        "PRICE_HISTORY_PATH": os.path.join(workdir, "history.sqlite"),
+    })
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    server = start_fake_serpapi(port, latency)
+
+    import io
+    import contextlib
+    import my_tools
+    import sources
+    import price_engine
+    from price_engine import fetch_many
+    from pricing import compute_market_stats
+    from inventory import peak_rss_mb
+    from analyst import StubAnalystModel, write_sectioned_report
+
+    inventory_path = os.path.join(workdir, f"inventory_{size}.csv")
+    write_inventory(inventory_path, size)
+    stages = {}
+
+    def timed(name, items, func, *args, **kwargs):
+        # The tools print per call; keep that out of the measurement and the output
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            result = func(*args, **kwargs)
+            elapsed = time.perf_counter() - started
+        stages[name] = {
+            "seconds": round(elapsed, 4),
+            "items_per_sec": round(items / elapsed, 1) if elapsed else None,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        return result
+
+    inventory = timed("extract_main_file", size, my_tools.extract_main_file, inventory_path)
+    listings = timed("track_price", size, fetch_many, list(inventory.keys()))
+    rows = timed("compute_market_stats", size, compute_market_stats, inventory, listings)
+    timed("save_search", size, my_tools.save_search, json.dumps(rows, ensure_ascii=False))
+    market_data = timed("file_to_analyze", size, my_tools.file_to_analyze)
+    timed("analyst_stub", size, asyncio.run, write_sectioned_report(market_data, StubAnalystModel()))
+    cached = timed("track_price_cached", size, fetch_many, list(inventory.keys()))
+    # Nothing may keep running (or retrying against a stopped server) once the result is reported
+    sources.shutdown()
+    price_engine.serpapi.reset()
+    server.shutdown()
+
+    failed = sum(1 for result in cached.values() if not isinstance(result, list))
+    return {
+        "size": size,
+        "latency_ms": latency * 1000,
+        "failed_fetches": failed,
+        "total_seconds": round(sum(stage["seconds"] for name, stage in stages.items()
+                                   if name != "track_price_cached"), 4),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pricing pipeline against a fake SerpApi.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma separated catalog sizes")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake SerpApi latency per request, seconds")
+    parser.add_argument("--output", help="Write the JSON report to this file as well")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        with tempfile.TemporaryDirectory() as workdir:
+            result = run_single(args.single, args.latency, workdir)
+        # The child's stdout also carries tool output, so the result goes to a file of its own
+        with open(args.result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    # One subprocess per size, so peak RSS is measured per catalog size
+    results = []
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        with tempfile.TemporaryDirectory() as resultdir:
+            result_file = os.path.join(resultdir, "result.json")
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--single", str(size), "--latency", str(args.latency),
+                 "--result-file", result_file],
+                capture_output=True, text=True
+            )
+            if completed.returncode != 0 or not os.path.exists(result_file):
+                results.append({"size": size, "error": completed.stderr.strip().splitlines()[-1:]})
+                continue
+            with open(result_file, "r", encoding="utf-8") as f:
+                result = json.load(f)
+        results.append(result)
+        print(f"[BENCH] {size} SKUs: {result['total_seconds']}s, peak {result['peak_rss_mb']} MB", file=sys.stderr)
+
+    report = {"python": sys.version.split()[0], "created_at": time.time(), "results": results}
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
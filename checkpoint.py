@@ -0,0 +1,119 @@
+import contextvars
+import sqlite3
+import threading
+import json
+import time
+import uuid
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", os.path.join("cache", "checkpoints.sqlite"))
+
+# The run whose progress the current task/thread is checkpointing; set by main_async
+current_run = contextvars.ContextVar("current_run", default=None)
+
+PHASES = ("started", "fetching", "statistics", "saved", "analyst", "done")
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+class CheckpointStore:
+    """
+    Durable record of a pipeline run: its current phase, every product fetch result and
+    the outputs of finished phases, so a crashed or failed run can pick up where it stopped.
+    """
+    def __init__(self, path: str = CHECKPOINT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " run_id TEXT PRIMARY KEY, file_name TEXT, phase TEXT NOT NULL,"
+                " created_at REAL NOT NULL, updated_at REAL NOT NULL, outputs TEXT NOT NULL DEFAULT '{}');"
+                "CREATE TABLE IF NOT EXISTS fetches ("
+                " run_id TEXT NOT NULL, product TEXT NOT NULL, result TEXT NOT NULL, fetched_at REAL NOT NULL,"
+                " PRIMARY KEY (run_id, product));"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def start(self, run_id: str, file_name: str | None = None):
+        """Registers the run if it's new; an existing run keeps its phase and fetches."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR IGNORE INTO runs (run_id, file_name, phase, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (run_id, file_name, "started", now, now)
+            )
+            conn.commit()
+
+    def get(self, run_id: str) -> dict | None:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT file_name, phase, created_at, updated_at, outputs FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            fetched = self._connect().execute(
+                "SELECT COUNT(*) FROM fetches WHERE run_id = ?", (run_id,)
+            ).fetchone()[0]
+        file_name, phase, created_at, updated_at, outputs = row
+        return {"run_id": run_id, "file_name": file_name, "phase": phase, "created_at": created_at,
+                "updated_at": updated_at, "outputs": json.loads(outputs), "products_fetched": fetched}
+
+    def set_phase(self, run_id: str, phase: str, output=None):
+        """Moves the run to `phase`, storing that phase's output when given."""
+        if phase not in PHASES:
+            raise ValueError(f"Unknown phase '{phase}', expected one of {PHASES}")
+        with self._lock:
+            conn = self._connect()
+            outputs = json.loads(conn.execute("SELECT outputs FROM runs WHERE run_id = ?", (run_id,)).fetchone()[0])
+            if output is not None:
+                outputs[phase] = output
+            conn.execute(
+                "UPDATE runs SET phase = ?, updated_at = ?, outputs = ? WHERE run_id = ?",
+                (phase, time.time(), json.dumps(outputs, ensure_ascii=False, default=str), run_id)
+            )
+            conn.commit()
+
+    def record_fetch(self, run_id: str, product: str, result):
+        """Only successful fetches are kept, so errors are retried on resume."""
+        if not isinstance(result, list):
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO fetches (run_id, product, result, fetched_at) VALUES (?, ?, ?, ?)",
+                (run_id, product, json.dumps(result, ensure_ascii=False), time.time())
+            )
+            conn.commit()
+
+    def fetched(self, run_id: str, products: list[str] | None = None) -> dict[str, list]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT product, result FROM fetches WHERE run_id = ?", (run_id,)
+            ).fetchall()
+        wanted = set(products) if products is not None else None
+        return {product: json.loads(result) for product, result in rows if wanted is None or product in wanted}
+
+    def runs(self, limit: int = 20) -> list[dict]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT run_id, file_name, phase, updated_at FROM runs ORDER BY updated_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [{"run_id": r, "file_name": f, "phase": p, "updated_at": u} for r, f, p, u in rows]
+
+
+checkpoints = CheckpointStore()
@@ -0,0 +1,110 @@
+import json
+import os
+from pricing import compute_market_stats, parse_price, is_comparable
+from listings import ListingTable
+from dotenv import load_dotenv
+load_dotenv()
+
+# How listings are shown to the model: full | trimmed | numeric | summary
+RESULT_ENCODING = os.getenv("TOOL_RESULT_ENCODING", "summary")
+# Upper bound on the estimated tokens of one tool response
+TOOL_TOKEN_BUDGET = int(os.getenv("TOOL_TOKEN_BUDGET", "4000"))
+ENCODINGS = ("full", "trimmed", "numeric", "summary")
+NUMERIC_COLUMNS = ["price", "rating", "reviews", "new"]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for JSON), good enough for budgeting."""
+    return (len(text) + 3) // 4
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_listings(product: str, listings, encoding: str = RESULT_ENCODING, stats: dict | None = None):
+    """
+    Encodes one product's listings (or error dict) in the requested compact form.
+    `stats` is the product's precomputed compute_market_stats row for the summary encoding.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}', expected one of {ENCODINGS}")
+    if not isinstance(listings, list) or encoding == "full":
+        return listings
+    if encoding == "trimmed":
+        return [
+            {"title": item.get("product_name"), "price": parse_price(item.get("price_numeric") or item.get("price_raw")),
+             "rating": item.get("rating"), "reviews": item.get("reviews"), "condition": item.get("condition")}
+            for item in listings
+        ]
+    if encoding == "numeric":
+        # Row layout is NUMERIC_COLUMNS, named once at the top of the batch payload
+        return [[parse_price(item.get("price_numeric") or item.get("price_raw")), item.get("rating"),
+                 item.get("reviews"), int(is_comparable(item))] for item in listings]
+    row = stats or compute_market_stats({product: None}, {product: listings})[0]
+    return {
+        "n": row["Listings Used"],
+        "avg": row["Market Average Price"],
+        "median": row["Market Median Price"],
+        "min": row["Market Min Price"],
+        "max": row["Market Max Price"],
+        "max_reviews": row["Maximum Number of reviews"],
+        "avg_rating": row["Average of all ratings"],
+    }
+
+
+def encode_batch(results: dict, encoding: str = RESULT_ENCODING, budget: int = TOOL_TOKEN_BUDGET) -> tuple[str, dict]:
+    """
+    Encodes as many products as fit in `budget` tokens. Returns the JSON payload and
+    a small report; products that didn't fit are listed under "pending" so the agent
+    can ask for them in a follow-up call. The caller must keep their listings for that
+    call (the price cache may be off), so the report also names them in "pending_products".
+    """
+    encoded, pending = {}, []
+    summaries = {}
+    if encoding == "summary":
+        # One vectorized pass over the whole batch instead of one per product
+        listed = {product: None for product, listings in results.items() if isinstance(listings, list)}
+        table = ListingTable.from_results({product: results[product] for product in listed}, keep_text=False)
+        summaries = {row["Product Name"]: row for row in compute_market_stats(listed, table)}
+    # Leave room for the worst case where every name ends up in the pending list
+    used = estimate_tokens(_dumps({"encoding": encoding, "cols": NUMERIC_COLUMNS, "results": {},
+                                   "pending": list(results)}))
+    for product, listings in results.items():
+        if pending:
+            pending.append(product)
+            continue
+        value = encode_listings(product, listings, encoding, summaries.get(product))
+        cost = estimate_tokens(_dumps({product: value}))
+        if encoded and used + cost > budget:
+            pending.append(product)
+            continue
+        encoded[product] = value
+        used += cost
+    payload = {"encoding": encoding, "results": encoded}
+    if encoding == "numeric":
+        payload["cols"] = NUMERIC_COLUMNS
+    if pending:
+        payload["pending"] = pending
+    text = _dumps(payload)
+    return text, {"products": len(encoded), "pending": len(pending), "tokens": estimate_tokens(text),
+                  "pending_products": pending}
+
+
+def chunk_products(products: list[str], encoding: str = RESULT_ENCODING, budget: int = TOOL_TOKEN_BUDGET,
+                   listings_per_product: int = 5) -> list[list[str]]:
+    """Splits a product list into chunks whose encoded results should each fit the budget."""
+    sample_listing = {"product_name": "x" * 60, "price_raw": "₹1,00,000.00", "price_numeric": 100000.0,
+                      "store": "x" * 20, "link": "x" * 120, "reviews": 1000, "rating": 4.5, "condition": "new"}
+    chunks, current, used = [], [], 0
+    for product in products:
+        value = encode_listings(product, [sample_listing] * listings_per_product, encoding)
+        cost = estimate_tokens(_dumps({product: value}))
+        if current and used + cost > budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(product)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
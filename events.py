@@ -0,0 +1,97 @@
+from collections import deque
+import contextvars
+import threading
+import asyncio
+import time
+
+# The job the current task/thread is working for; set by the backend before a run starts
+current_job = contextvars.ContextVar("current_job", default=None)
+
+SUBSCRIBER_QUEUE_SIZE = 256
+HISTORY_SIZE = 500
+ALL_JOBS = "*"
+
+
+class Subscriber:
+    """
+    One consumer of the bus (usually a websocket). Events are handed over through a
+    bounded queue on the consumer's own event loop; when the consumer falls behind the
+    oldest events are dropped so it can never stall the emitters or other clients.
+    """
+    def __init__(self, job_id: str, loop: asyncio.AbstractEventLoop, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.job_id = job_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def _put(self, event: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    def offer(self, event: dict):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # loop already closed
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+
+class EventBus:
+    def __init__(self, history_size: int = HISTORY_SIZE):
+        self.history_size = history_size
+        self._subscribers: dict[str, set[Subscriber]] = {}
+        self._history: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, job_id: str = ALL_JOBS, replay: bool = True) -> Subscriber:
+        """Must be called from the consumer's event loop. Replays the job's past events when asked."""
+        subscriber = Subscriber(job_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(job_id, set()).add(subscriber)
+            past = list(self._history.get(job_id, ())) if replay and job_id != ALL_JOBS else []
+        for event in past:
+            subscriber._put(event)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.job_id)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.job_id]
+
+    def emit(self, event_type: str, job_id: str | None = None, **data) -> dict | None:
+        """
+        Publishes a typed event for the given job, or for the job bound to the current
+        context. Safe to call from worker threads. Outside of a job this is a no-op.
+        """
+        job_id = job_id or current_job.get()
+        if job_id is None:
+            return None
+        event = {"type": event_type, "job_id": job_id, "ts": time.time(), **data}
+        with self._lock:
+            self._history.setdefault(job_id, deque(maxlen=self.history_size)).append(event)
+            targets = list(self._subscribers.get(job_id, ())) + list(self._subscribers.get(ALL_JOBS, ()))
+        for subscriber in targets:
+            subscriber.offer(event)
+        return event
+
+    def history(self, job_id: str) -> list[dict]:
+        with self._lock:
+            return list(self._history.get(job_id, ()))
+
+    def forget(self, job_id: str):
+        with self._lock:
+            self._history.pop(job_id, None)
+
+
+bus = EventBus()
+
+
+def emit(event_type: str, **data):
+    return bus.emit(event_type, **data)
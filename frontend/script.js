@@ -2,24 +2,96 @@ document.addEventListener('DOMContentLoaded', () => {
     const startAnalysisBtn = document.getElementById('start-analysis');
     const statusDiv = document.getElementById('status');
     const resultsDiv = document.getElementById('results');
-    
-    const socket = new WebSocket('ws://localhost:8000/ws');
+    let socket = null;
 
-    socket.onopen = () => {
-        statusDiv.textContent = 'Connected to the server.';
+    const appendLine = (text) => {
+        const line = document.createElement('div');
+        line.textContent = text;
+        resultsDiv.appendChild(line);
     };
 
-    socket.onmessage = (event) => {
-        resultsDiv.innerHTML += event.data.replace(/\n/g, '<br>');
+    // Report text comes from the model and file names from the request, so it is never parsed as HTML
+    const appendBlock = (title, text) => {
+        const heading = document.createElement('h2');
+        const body = document.createElement('pre');
+        heading.textContent = title;
+        body.textContent = text;
+        resultsDiv.append(heading, body);
     };
 
-    socket.onclose = () => {
-        statusDiv.textContent = 'Disconnected from the server.';
+    // FastAPI's 422 responses carry a list of {loc, msg} objects in `detail`
+    const errorText = (data) => {
+        if (Array.isArray(data.detail)) {
+            return data.detail.map((item) => item.msg || JSON.stringify(item)).join('; ');
+        }
+        return data.message || (typeof data.detail === 'string' ? data.detail : JSON.stringify(data.detail));
     };
 
-    socket.onerror = (error) => {
-        console.error('WebSocket Error:', error);
-        statusDiv.textContent = 'An error occurred with the connection.';
+    const renderEvent = (event) => {
+        switch (event.type) {
+            case 'job_status':
+                statusDiv.textContent = `Job ${event.job_id} is ${event.status}${event.error ? ': ' + event.error : ''}`;
+                break;
+            case 'progress':
+                statusDiv.textContent = `${event.phase}... ${event.progress}%`;
+                break;
+            case 'tool_call':
+            case 'agent_tool_call':
+                appendLine(`[${event.agent || 'tool'}] Calling ${event.tool}`);
+                break;
+            case 'product_fetched':
+                appendLine(`${event.ok ? '✔' : '✘'} ${event.product} (${event.listings} listings)`);
+                break;
+            case 'verdict_saved':
+                appendLine(`Saved ${event.rows} products to ${event.file_name}`);
+                break;
+            case 'agent_message':
+                appendLine(`[${event.agent}]: ${event.text}`);
+                break;
+            case 'report_section': {
+                // Sections arrive as soon as each one is written, not in catalog order
+                const section = document.createElement('div');
+                const heading = document.createElement('h3');
+                const body = document.createElement('pre');
+                heading.textContent = event.title;
+                body.textContent = event.error ? `Section failed: ${event.error}` : event.text;
+                section.append(heading, body);
+                resultsDiv.appendChild(section);
+                break;
+            }
+            case 'report_ready':
+                statusDiv.textContent = 'Analysis complete.';
+                if (event.summary !== undefined) {
+                    appendBlock('Summary', event.summary);
+                    break;
+                }
+                appendBlock('Final Report', event.report || '');
+                break;
+            case 'resilience':
+                if (event.state === 'circuit_open') {
+                    appendLine(`${event.upstream} is failing, pausing requests`);
+                }
+                break;
+            case 'error':
+                appendLine(`Error: ${event.message}`);
+                break;
+        }
+    };
+
+    const followJob = (jobId) => {
+        if (socket) {
+            socket.close();
+        }
+        socket = new WebSocket(`ws://localhost:8000/ws/${jobId}`);
+
+        socket.onmessage = (message) => {
+            renderEvent(JSON.parse(message.data));
+        };
+
+        socket.onerror = (error) => {
+            console.error('WebSocket Error:', error);
+            statusDiv.textContent = 'An error occurred with the connection.';
+        };
     };
 
     startAnalysisBtn.addEventListener('click', () => {
@@ -33,8 +105,12 @@ document.addEventListener('DOMContentLoaded', () => {
         .then(data => {
             if (data.status !== 'success') {
                 statusDiv.textContent = 'An error occurred.';
-                resultsDiv.innerHTML = `<p>Error: ${data.message}</p>`;
+                const message = document.createElement('p');
+                message.textContent = `Error: ${errorText(data)}`;
+                resultsDiv.replaceChildren(message);
+                return;
             }
+            followJob(data.job_id);
         })
         .catch(error => {
             statusDiv.textContent = 'An error occurred.';
@@ -42,4 +118,3 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     });
 });
-
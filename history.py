@@ -0,0 +1,143 @@
+import sqlite3
+import threading
+import json
+import time
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+HISTORY_PATH = os.getenv("PRICE_HISTORY_PATH", os.path.join("verdict", "history.sqlite"))
+
+NAME_KEYS = ("Product Name", "Product", "name", "title", "product_name")
+AVERAGE_KEYS = ("Market Average Price", "Market Average", "Average Price")
+LISTING_KEYS = ("Original Listing Price", "Listing Price", "My Price")
+
+
+def _first(row: dict, keys: tuple):
+    for key in keys:
+        if row.get(key) not in (None, ""):
+            return row[key]
+    return None
+
+
+def _number(value):
+    try:
+        return float(str(value).replace(",", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+class PriceHistory:
+    """
+    Append-only store of every verdict row, indexed by product and time so that
+    per-SKU time series and the latest snapshot can be read without opening workbooks.
+    """
+    def __init__(self, path: str = HISTORY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " run_id TEXT PRIMARY KEY, created_at REAL NOT NULL, verdict_file TEXT, products INTEGER);"
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                " run_id TEXT NOT NULL, product TEXT NOT NULL, ts REAL NOT NULL,"
+                " listing_price REAL, market_average REAL, status TEXT, data TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS idx_snapshots_product_ts ON snapshots(product, ts);"
+                "CREATE INDEX IF NOT EXISTS idx_snapshots_run ON snapshots(run_id);"
+                "CREATE INDEX IF NOT EXISTS idx_runs_created ON runs(created_at);"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def append_run(self, run_id: str, rows: list[dict], verdict_file: str | None = None,
+                   created_at: float | None = None) -> int:
+        """Stores one run's verdict rows, returns how many product rows were written."""
+        created_at = created_at or time.time()
+        records = []
+        for row in rows:
+            product = _first(row, NAME_KEYS)
+            if not product:
+                continue
+            records.append((
+                run_id, str(product), created_at,
+                _number(_first(row, LISTING_KEYS)), _number(_first(row, AVERAGE_KEYS)),
+                row.get("Status"), json.dumps(row, ensure_ascii=False, default=str)
+            ))
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO runs (run_id, created_at, verdict_file, products) VALUES (?, ?, ?, ?)",
+                (run_id, created_at, verdict_file, len(records))
+            )
+            conn.execute("DELETE FROM snapshots WHERE run_id = ?", (run_id,))
+            conn.executemany(
+                "INSERT INTO snapshots (run_id, product, ts, listing_price, market_average, status, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", records
+            )
+            conn.commit()
+        return len(records)
+
+    def product_history(self, product: str, days: float = 90) -> list[dict]:
+        """Time series of one product's verdict rows over the last `days` days, oldest first."""
+        since = time.time() - days * 24 * 60 * 60
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT run_id, ts, listing_price, market_average, status FROM snapshots "
+                "WHERE product = ? AND ts >= ? ORDER BY ts", (product, since)
+            ).fetchall()
+        return [
+            {"run_id": run_id, "ts": ts, "listing_price": listing, "market_average": average, "status": status}
+            for run_id, ts, listing, average, status in rows
+        ]
+
+    def latest_snapshot(self, products: list[str] | None = None) -> dict[str, dict]:
+        """The most recent verdict row of every product (or of the given ones), keyed by product."""
+        query = (
+            "SELECT s.product, s.data FROM snapshots s JOIN ("
+            " SELECT product, MAX(ts) AS ts FROM snapshots {where} GROUP BY product"
+            ") latest ON s.product = latest.product AND s.ts = latest.ts"
+        )
+        params = []
+        where = ""
+        if products:
+            where = f"WHERE product IN ({','.join('?' * len(products))})"
+            params = list(products)
+        with self._lock:
+            rows = self._connect().execute(query.format(where=where), params).fetchall()
+        return {product: json.loads(data) for product, data in rows}
+
+    def latest_run_id(self) -> str | None:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT run_id FROM runs ORDER BY created_at DESC LIMIT 1"
+            ).fetchone()
+        return row[0] if row else None
+
+    def run_rows(self, run_id: str) -> list[dict]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT data FROM snapshots WHERE run_id = ? ORDER BY rowid", (run_id,)
+            ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def runs(self, limit: int = 50) -> list[dict]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT run_id, created_at, verdict_file, products FROM runs ORDER BY created_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [
+            {"run_id": run_id, "created_at": created_at, "verdict_file": verdict_file, "products": products}
+            for run_id, created_at, verdict_file, products in rows
+        ]
+
+
+price_history = PriceHistory()
@@ -0,0 +1,139 @@
+from typing import Iterator, NamedTuple
+import openpyxl
+import csv
+import time
+import os
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+NAME_HEADERS = ("product name", "product description", "product", "name", "title", "product_name")
+PRICE_HEADERS = ("cost price", "price", "my prices", "listing price", "cost", "price_numeric")
+
+
+class InventoryRecord(NamedTuple):
+    name: str
+    price: float
+    row: int
+
+
+class LoadStats:
+    """Throughput and memory figures for one pass over an inventory file."""
+    def __init__(self):
+        self.rows_read = 0
+        self.rows_yielded = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows_read / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "rows_read": self.rows_read,
+            "products": self.rows_yielded,
+            "seconds": round(self.elapsed, 3),
+            "rows_per_sec": round(self.rows_per_sec, 1),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None where the platform can't tell us."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return round(peak / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)
+
+
+def _to_price(value):
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(str(value).replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+def _header_columns(row) -> tuple[int, int] | None:
+    """Returns (name column, price column) when the row looks like a header, else None."""
+    labels = [str(cell).strip().lower() if cell is not None else "" for cell in row]
+    name_col = next((i for i, label in enumerate(labels) if label in NAME_HEADERS), None)
+    price_col = next((i for i, label in enumerate(labels) if label in PRICE_HEADERS), None)
+    if name_col is None and price_col is None:
+        return None
+    return (0 if name_col is None else name_col, 1 if price_col is None else price_col)
+
+
+def _xlsx_rows(file_name: str):
+    workbook = openpyxl.load_workbook(file_name, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _csv_rows(file_name: str):
+    with open(file_name, newline="", encoding="utf-8-sig") as f:
+        yield from csv.reader(f)
+
+
+def _parquet_rows(file_name: str, batch_size: int = 65536):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading Parquet inventories needs pyarrow: pip install pyarrow")
+    parquet_file = pq.ParquetFile(file_name)
+    yield tuple(parquet_file.schema_arrow.names)
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        yield from zip(*(column.to_pylist() for column in batch.columns))
+
+
+READERS = {
+    ".xlsx": _xlsx_rows,
+    ".xlsm": _xlsx_rows,
+    ".csv": _csv_rows,
+    ".parquet": _parquet_rows,
+}
+
+
+def iter_inventory(file_name: str, stats: LoadStats | None = None) -> Iterator[InventoryRecord]:
+    """
+    Streams product records out of an inventory file in a single pass.
+    Args:
+        file_name: An .xlsx, .csv or .parquet file with a product name and a price column.
+        stats: Optional LoadStats that is filled in as rows are read.
+    Rows without a name or with a non-numerical price are skipped.
+    """
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension not in READERS:
+        raise ValueError(f"Unsupported inventory format '{extension}', expected one of {sorted(READERS)}")
+    stats = stats or LoadStats()
+    name_col, price_col = 0, 1
+    try:
+        for row_num, row in enumerate(READERS[extension](file_name), start=1):
+            stats.rows_read += 1
+            if row_num == 1:
+                header = _header_columns(row)
+                if header:
+                    name_col, price_col = header
+                    continue
+            if not row or len(row) <= max(name_col, price_col):
+                continue
+            name = row[name_col]
+            price = _to_price(row[price_col])
+            if not name or price is None:
+                continue
+            stats.rows_yielded += 1
+            yield InventoryRecord(str(name).strip(), price, row_num)
+    finally:
+        stats.finish()
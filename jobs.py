@@ -0,0 +1,177 @@
+import asyncio
+import threading
+import uuid
+import time
+import os
+from events import bus, current_job
+from resilience import cancel_signal
+from dotenv import load_dotenv
+load_dotenv()
+
+WORKER_COUNT = int(os.getenv("ANALYSIS_WORKERS", "2"))
+QUEUE_SIZE = int(os.getenv("ANALYSIS_QUEUE_SIZE", "16"))
+MAX_FINISHED_JOBS = 200
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+async def run_in_thread(fn, *args, **kwargs):
+    """
+    asyncio.to_thread for a job's blocking stage. When the calling task is cancelled, it sets the
+    job's cancel signal and waits for the thread to stop before re-raising, so the job isn't
+    reported finished while the thread is still fetching and saving.
+    """
+    thread = asyncio.ensure_future(asyncio.to_thread(fn, *args, **kwargs))
+    try:
+        return await asyncio.shield(thread)
+    except asyncio.CancelledError:
+        cancel = cancel_signal.get()
+        if cancel is not None:
+            cancel.set()
+            print(f"[INFO] Waiting for {fn.__name__} to stop after the job was cancelled")
+            try:
+                await thread
+            except Exception:
+                pass
+        raise
+
+
+class Job:
+    def __init__(self, key: str, params: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.params = params
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.task: asyncio.Task | None = None
+        # Seen by the runner's worker threads through resilience.cancel_signal
+        self.cancel_event = threading.Event()
+
+    def as_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "params": self.params,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Bounded queue of analysis jobs served by a fixed pool of asyncio workers.
+    Submitting the same parameters while an equal job is still queued or running
+    returns that job instead of starting a second pipeline. A cancelled job stays active
+    until its runner has returned, including any pricing thread still winding down.
+    """
+    def __init__(self, runner, workers: int = WORKER_COUNT, queue_size: int = QUEUE_SIZE):
+        self.runner = runner
+        self.worker_count = workers
+        self.queue: asyncio.Queue | None = None
+        self.queue_size = queue_size
+        self.jobs: dict[str, Job] = {}
+        self._active: dict[str, Job] = {}
+        self._workers: list[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self):
+        self._stopping = False
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.worker_count)]
+
+    async def stop(self):
+        self._stopping = True
+        for job in self.jobs.values():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, **params) -> Job:
+        key = repr(sorted(params.items()))
+        existing = self._active.get(key)
+        if existing and existing.status not in FINISHED:
+            return existing
+        job = Job(key, params)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Job queue is full ({self.queue_size} pending)")
+        self.jobs[job.id] = job
+        self._active[key] = job
+        self._prune()
+        bus.emit("job_status", job_id=job.id, status=QUEUED)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Job | None:
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        job.cancel_event.set()
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            # Still queued, the worker will skip it
+            self._finish(job, CANCELLED)
+        return job
+
+    def _finish(self, job: Job, status: str, result=None, error: str | None = None):
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        if self._active.get(job.key) is job:
+            del self._active[job.key]
+        bus.emit("job_status", job_id=job.id, status=status, error=error)
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job.status in FINISHED]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.id]
+            bus.forget(job.id)
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self.queue.get()
+            try:
+                if job.status == CANCELLED:
+                    continue
+                job.status = RUNNING
+                job.started_at = time.time()
+                bus.emit("job_status", job_id=job.id, status=RUNNING)
+                # Everything the runner emits (including from its threads) is scoped to this job
+                token = current_job.set(job.id)
+                cancel_token = cancel_signal.set(job.cancel_event)
+                try:
+                    job.task = asyncio.create_task(self.runner(job))
+                finally:
+                    cancel_signal.reset(cancel_token)
+                    current_job.reset(token)
+                try:
+                    result = await job.task
+                    self._finish(job, DONE, result=result)
+                except asyncio.CancelledError:
+                    self._finish(job, CANCELLED)
+                    if self._stopping:
+                        raise
+                except Exception as e:
+                    print(f"[ERROR] Job {job.id} failed: {e}")
+                    self._finish(job, FAILED, error=str(e))
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,171 @@
+from array import array
+import numpy as np
+from pricing import parse_price, is_comparable
+
+MISSING = float("nan")
+
+
+class _Interner:
+    """Maps repeated strings (store names, conditions, sources) to small integer ids."""
+    __slots__ = ("values", "_ids")
+
+    def __init__(self):
+        self.values: list = []
+        self._ids: dict = {}
+
+    def id(self, value) -> int:
+        found = self._ids.get(value)
+        if found is None:
+            found = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return found
+
+
+class ListingTable:
+    """
+    Columnar store of competitor listings. Numbers live in contiguous typed arrays
+    (one machine value per listing instead of a dict of boxed objects), repeated strings
+    are interned, and the numeric columns convert to NumPy without copying.
+    Prices, ratings and reviews are parsed once on the way in; missing values are NaN.
+    """
+    __slots__ = ("products", "_product_ids", "product_id", "price", "rating", "reviews", "comparable",
+                 "store_id", "condition_id", "source_id", "_stores", "_conditions", "_sources",
+                 "title", "price_raw", "link", "keep_text")
+
+    def __init__(self, keep_text: bool = True):
+        self.products: list[str] = []
+        self._product_ids: dict[str, int] = {}
+        self.product_id = array("i")
+        self.price = array("d")
+        self.rating = array("d")
+        self.reviews = array("d")
+        self.comparable = array("b")
+        self.store_id = array("i")
+        self.condition_id = array("i")
+        self.source_id = array("i")
+        self._stores = _Interner()
+        self._conditions = _Interner()
+        self._sources = _Interner()
+        # Titles and links are only needed for reports; drop them to keep just the numbers
+        self.keep_text = keep_text
+        self.title: list = []
+        self.price_raw: list = []
+        self.link: list = []
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+    def product_index(self, product: str) -> int:
+        found = self._product_ids.get(product)
+        if found is None:
+            found = self._product_ids[product] = len(self.products)
+            self.products.append(product)
+        return found
+
+    def add(self, product: str, listing: dict):
+        price = listing.get("price_numeric")
+        if not isinstance(price, (int, float)) or isinstance(price, bool):
+            price = parse_price(price)
+        if price is None:
+            price = parse_price(listing.get("price_raw"))
+        rating = parse_price(listing.get("rating"))
+        self.product_id.append(self.product_index(product))
+        self.price.append(MISSING if price is None else price)
+        self.rating.append(MISSING if rating is None else rating)
+        self.reviews.append(parse_price(listing.get("reviews")) or 0.0)
+        self.comparable.append(is_comparable(listing))
+        self.store_id.append(self._stores.id(listing.get("store")))
+        self.condition_id.append(self._conditions.id(listing.get("condition") or "new"))
+        self.source_id.append(self._sources.id(listing.get("source")))
+        if self.keep_text:
+            self.title.append(listing.get("product_name"))
+            self.price_raw.append(listing.get("price_raw"))
+            self.link.append(listing.get("link"))
+
+    def extend(self, product: str, listings):
+        """Adds a product's listings; anything that isn't a list (an error dict) just registers the product."""
+        self.product_index(product)
+        if isinstance(listings, list):
+            for listing in listings:
+                self.add(product, listing)
+
+    @classmethod
+    def from_results(cls, listings_by_product: dict, keep_text: bool = True) -> "ListingTable":
+        """Builds a table from {product: listings or {"error": ...}}, as returned by fetch_many."""
+        table = cls(keep_text)
+        for product, listings in listings_by_product.items():
+            table.extend(product, listings)
+        return table
+
+    def numpy(self) -> dict[str, np.ndarray]:
+        """Zero-copy NumPy views of the numeric columns (the table can't grow while they're alive)."""
+        return {
+            "product_id": np.frombuffer(self.product_id, dtype=np.int32),
+            "price": np.frombuffer(self.price, dtype=np.float64),
+            "rating": np.frombuffer(self.rating, dtype=np.float64),
+            "reviews": np.frombuffer(self.reviews, dtype=np.float64),
+            "comparable": np.frombuffer(self.comparable, dtype=np.int8).astype(bool),
+        }
+
+    def row(self, index: int) -> dict:
+        """One listing back in the cleaned dict shape used by the price sources."""
+        price, rating = self.price[index], self.rating[index]
+        return {
+            "product_name": self.title[index] if self.keep_text else None,
+            "price_raw": self.price_raw[index] if self.keep_text else None,
+            "price_numeric": None if price != price else price,
+            "store": self._stores.values[self.store_id[index]],
+            "link": self.link[index] if self.keep_text else None,
+            "reviews": int(self.reviews[index]),
+            "rating": None if rating != rating else rating,
+            "condition": self._conditions.values[self.condition_id[index]],
+            "source": self._sources.values[self.source_id[index]],
+        }
+
+    def rows(self):
+        """Yields (product, listing dict, comparable) for every listing, in insertion order."""
+        for index in range(len(self)):
+            yield self.products[self.product_id[index]], self.row(index), bool(self.comparable[index])
+
+    def listings(self, product: str) -> list[dict]:
+        gid = self._product_ids.get(product)
+        if gid is None:
+            return []
+        return [self.row(index) for index in range(len(self)) if self.product_id[index] == gid]
+
+    def to_columns(self) -> dict:
+        """Compact JSON-friendly form: one list per column plus the interned string tables."""
+        columns = {
+            "products": self.products,
+            "product_id": self.product_id.tolist(),
+            "price": [None if v != v else v for v in self.price],
+            "rating": [None if v != v else v for v in self.rating],
+            "reviews": self.reviews.tolist(),
+            "comparable": self.comparable.tolist(),
+            "stores": self._stores.values, "store_id": self.store_id.tolist(),
+            "conditions": self._conditions.values, "condition_id": self.condition_id.tolist(),
+            "sources": self._sources.values, "source_id": self.source_id.tolist(),
+        }
+        if self.keep_text:
+            columns.update(title=self.title, price_raw=self.price_raw, link=self.link)
+        return columns
+
+    @classmethod
+    def from_columns(cls, columns: dict) -> "ListingTable":
+        table = cls(keep_text="title" in columns)
+        for product in columns["products"]:
+            table.product_index(product)
+        table.product_id.extend(columns["product_id"])
+        table.price.extend(MISSING if v is None else v for v in columns["price"])
+        table.rating.extend(MISSING if v is None else v for v in columns["rating"])
+        table.reviews.extend(columns["reviews"])
+        table.comparable.extend(columns["comparable"])
+        for name, interner, ids in (("stores", table._stores, table.store_id),
+                                    ("conditions", table._conditions, table.condition_id),
+                                    ("sources", table._sources, table.source_id)):
+            for value in columns[name]:
+                interner.id(value)
+            ids.extend(columns[name[:-1] + "_id"])
+        if table.keep_text:
+            table.title, table.price_raw, table.link = list(columns["title"]), list(columns["price_raw"]), list(columns["link"])
+        return table
@@ -0,0 +1,180 @@
+from collections import OrderedDict
+import functools
+import threading
+import time
+from events import current_job
+from checkpoint import current_run
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+MAX_TRACKED_JOBS = 200
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: dict | None = None) -> str:
+    pairs = list(key) + sorted((extra or {}).items())
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, doc: str):
+        self.name = name
+        self.doc = doc
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}  # key -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in self._series.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, {'le': bound})} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, doc: str):
+        self.name = name
+        self.doc = doc
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram | Gauge] = {}
+        self._jobs: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, doc: str) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, doc))
+
+    def gauge(self, name: str, doc: str) -> Gauge:
+        return self._metrics.setdefault(name, Gauge(name, doc))
+
+    def histogram(self, name: str, doc: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, doc, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def record_job(self, name: str, seconds: float, job_id: str | None = None):
+        """
+        Adds one timed call to the running per-job summary of the current job, or of the
+        current run for CLI runs that have no job.
+        """
+        job_id = job_id or current_job.get() or current_run.get()
+        if job_id is None:
+            return
+        with self._lock:
+            job = self._jobs.setdefault(job_id, {})
+            self._jobs.move_to_end(job_id)
+            entry = job.setdefault(name, {"calls": 0, "seconds": 0.0})
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            while len(self._jobs) > MAX_TRACKED_JOBS:
+                self._jobs.popitem(last=False)
+
+    def job_summary(self, job_id: str) -> dict:
+        with self._lock:
+            job = self._jobs.get(job_id, {})
+            return {name: {"calls": e["calls"], "seconds": round(e["seconds"], 3)} for name, e in job.items()}
+
+
+registry = Registry()
+
+TOOL_SECONDS = registry.histogram("retail_radar_tool_seconds", "Latency of agent tools in my_tools.py")
+TOOL_ERRORS = registry.counter("retail_radar_tool_errors_total", "Tool calls that raised or returned an error")
+SERPAPI_SECONDS = registry.histogram("retail_radar_serpapi_request_seconds", "Latency of SerpApi requests")
+SERPAPI_REQUESTS = registry.counter("retail_radar_serpapi_requests_total", "SerpApi requests by outcome")
+SOURCE_SECONDS = registry.histogram("retail_radar_price_source_seconds", "Latency of price source requests by source")
+SOURCE_REQUESTS = registry.counter("retail_radar_price_source_requests_total", "Price source requests by source and outcome")
+RETRIES = registry.counter("retail_radar_upstream_retries_total", "Retried upstream calls by upstream and reason")
+THROTTLED = registry.counter("retail_radar_upstream_throttled_total", "Upstream calls rejected with 429 by upstream")
+CIRCUIT_OPENED = registry.counter("retail_radar_upstream_circuit_opened_total", "Times an upstream circuit breaker opened")
+UPSTREAM_RATE = registry.gauge("retail_radar_upstream_rate_per_second", "Current adaptive request rate per upstream")
+COALESCED = registry.counter("retail_radar_serpapi_coalesced_total", "Fetches served by an equivalent in-flight request")
+CACHE_LOOKUPS = registry.counter("retail_radar_price_cache_lookups_total", "Price cache lookups by result")
+AGENT_TURN_SECONDS = registry.histogram("retail_radar_agent_turn_seconds", "Time between consecutive agent events")
+LLM_TOKENS = registry.counter("retail_radar_llm_tokens_total", "Gemini tokens used by agent and kind")
+WS_EVENTS = registry.counter("retail_radar_ws_events_sent_total", "Events delivered to websocket clients")
+WS_SEND_SECONDS = registry.histogram("retail_radar_ws_send_seconds", "Time to push one event to a websocket")
+
+
+def observe_job(name: str, seconds: float):
+    registry.record_job(name, seconds)
+
+
+def timed_tool(func):
+    """Records latency and errors of a tool, keeping its signature and docstring for the agent."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        failed = False
+        try:
+            result = func(*args, **kwargs)
+            failed = isinstance(result, dict) and (result.get("status") == "Error" or "error" in result)
+            return result
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            TOOL_SECONDS.observe(elapsed, tool=func.__name__)
+            if failed:
+                TOOL_ERRORS.inc(tool=func.__name__)
+            observe_job(f"tool:{func.__name__}", elapsed)
+    return wrapper
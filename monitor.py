@@ -0,0 +1,238 @@
+"""
+Continuous price monitoring.
+
+Watched SKUs live in a SQLite table indexed by their next due time, each with its own
+re-check interval. Every tick the scheduler takes only as many due SKUs as the hourly
+request quota allows, fetches them, and emits a "price_alert" event when the market
+average or the lowest competitor price moved more than the threshold since the last check.
+
+    python monitor.py watch --file book.xlsx --interval 86400
+    python monitor.py watch "iPhone 17 Pro" "OnePlus 15" --interval 3600
+    python monitor.py run
+"""
+import argparse
+import asyncio
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+import uuid
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+MONITOR_PATH = os.getenv("MONITOR_PATH", os.path.join("cache", "monitor.sqlite"))
+# Long-tail SKUs are re-checked daily unless given their own interval
+DEFAULT_INTERVAL = float(os.getenv("MONITOR_DEFAULT_INTERVAL", "86400"))
+# SerpApi requests the monitor may spend per hour, spread evenly over each hour
+REQUESTS_PER_HOUR = float(os.getenv("MONITOR_REQUESTS_PER_HOUR", "600"))
+TICK_SECONDS = float(os.getenv("MONITOR_TICK_SECONDS", "30"))
+# Relative move (0.05 = 5%) of the market average or competitor min that raises an alert
+CHANGE_THRESHOLD = float(os.getenv("MONITOR_CHANGE_THRESHOLD", "0.05"))
+# Alerts are published on the event bus under this job id
+MONITOR_JOB = "monitor"
+# Run the scheduler inside the backend process
+MONITOR_ENABLED = os.getenv("MONITOR_ENABLED", "0") == "1"
+
+
+def _offset(product: str, interval: float) -> float:
+    # Stable per-SKU offset, so SKUs added together don't all come due at the same moment
+    return int(hashlib.md5(product.encode("utf-8")).hexdigest()[:8], 16) % max(1, int(interval))
+
+
+def relative_change(old, new) -> float | None:
+    if old in (None, 0) or new is None:
+        return None
+    return (new - old) / old
+
+
+class WatchList:
+    """Watched SKUs with their interval, next due time and last observed market values."""
+    def __init__(self, path: str = MONITOR_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS watch ("
+                " product TEXT PRIMARY KEY, price REAL, interval REAL NOT NULL, next_due REAL NOT NULL,"
+                " last_checked REAL, market_average REAL, market_min REAL);"
+                "CREATE INDEX IF NOT EXISTS idx_watch_due ON watch(next_due);"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def watch(self, inventory: dict, interval: float = DEFAULT_INTERVAL, now: float | None = None) -> int:
+        """
+        Adds {product: price} to the watch list, or updates the price and interval of
+        SKUs already on it. New SKUs get their first check spread over one interval.
+        Raises ValueError unless the interval is a positive, finite number of seconds.
+        """
+        if not (math.isfinite(interval) and interval > 0):
+            raise ValueError(f"Watch interval must be a positive number of seconds, got {interval}")
+        now = now or time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT INTO watch (product, price, interval, next_due) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(product) DO UPDATE SET price = COALESCE(excluded.price, watch.price), interval = excluded.interval, "
+                "next_due = MIN(watch.next_due, COALESCE(watch.last_checked, watch.next_due) + excluded.interval)",
+                [(product, price, interval, now + _offset(product, interval)) for product, price in inventory.items()]
+            )
+            conn.commit()
+        return len(inventory)
+
+    def unwatch(self, products: list[str]) -> int:
+        with self._lock:
+            conn = self._connect()
+            removed = conn.executemany("DELETE FROM watch WHERE product = ?", [(p,) for p in products]).rowcount
+            conn.commit()
+        return removed
+
+    def due(self, limit: int, now: float | None = None) -> list[tuple]:
+        """Oldest-due SKUs first: (product, price, interval, market_average, market_min)."""
+        with self._lock:
+            return self._connect().execute(
+                "SELECT product, price, interval, market_average, market_min FROM watch "
+                "WHERE next_due <= ? ORDER BY next_due LIMIT ?",
+                (now or time.time(), limit)
+            ).fetchall()
+
+    def record(self, updates: list[tuple], now: float | None = None):
+        """updates: (product, market_average, market_min). Reschedules each SKU one interval ahead."""
+        now = now or time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "UPDATE watch SET last_checked = ?, next_due = ? + interval, "
+                "market_average = COALESCE(?, market_average), market_min = COALESCE(?, market_min) "
+                "WHERE product = ?",
+                [(now, now, average, minimum, product) for product, average, minimum in updates]
+            )
+            conn.commit()
+
+    def stats(self, now: float | None = None) -> dict:
+        with self._lock:
+            watched, due, demand = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(next_due <= ?), 0), COALESCE(SUM(3600.0 / interval), 0) FROM watch",
+                (now or time.time(),)
+            ).fetchone()
+        return {"watched": watched, "due": due, "requests_per_hour_needed": round(demand, 1),
+                "requests_per_hour_quota": REQUESTS_PER_HOUR}
+
+
+class Monitor:
+    """
+    Drains due SKUs at a steady rate. Request credits accrue continuously at
+    `requests_per_hour`, so a backlog is worked off evenly instead of in bursts.
+    """
+    def __init__(self, watchlist: WatchList, requests_per_hour: float = REQUESTS_PER_HOUR,
+                 threshold: float = CHANGE_THRESHOLD):
+        self.watchlist = watchlist
+        self.requests_per_hour = requests_per_hour
+        self.threshold = threshold
+        self._credits = 0.0
+        self._last_tick = None
+
+    def check_once(self, now: float | None = None) -> list[dict]:
+        """Checks as many due SKUs as the quota allows right now; returns the alerts raised."""
+        from price_engine import fetch_many
+        from pricing import compute_market_stats
+        from events import bus
+
+        now = now or time.time()
+        elapsed = TICK_SECONDS if self._last_tick is None else now - self._last_tick
+        self._last_tick = now
+        # Never bank more than one tick's worth, so an idle period doesn't turn into a burst
+        per_tick = self.requests_per_hour * TICK_SECONDS / 3600
+        self._credits = min(max(per_tick, 1.0), self._credits + self.requests_per_hour * elapsed / 3600)
+        if self._credits < 1:
+            return []
+        due = self.watchlist.due(int(self._credits), now)
+        if not due:
+            return []
+        self._credits -= len(due)
+
+        inventory = {product: price for product, price, _, _, _ in due}
+        listings = fetch_many(list(inventory), force_refresh=True)
+        rows = {row["Product Name"]: row for row in compute_market_stats(inventory, listings)}
+        alerts, updates = [], []
+        for product, _, _, old_average, old_min in due:
+            row = rows.get(product)
+            if row is None or not row["Listings Used"]:
+                # Failed or empty fetch: keep the last values and try again next interval
+                updates.append((product, None, None))
+                continue
+            average, minimum = row["Market Average Price"], row["Market Min Price"]
+            updates.append((product, average, minimum))
+            for field, old, new in (("market_average", old_average, average), ("market_min", old_min, minimum)):
+                change = relative_change(old, new)
+                if change is not None and abs(change) >= self.threshold:
+                    alert = {"product": product, "field": field, "old": old, "new": new,
+                             "change": round(change, 4), "listing_price": row["Original Listing Price"]}
+                    alerts.append(alert)
+                    bus.emit("price_alert", job_id=MONITOR_JOB, **alert)
+        self.watchlist.record(updates, now)
+        changed = {alert["product"]: rows[alert["product"]] for alert in alerts}
+        if changed:
+            # Only moves are worth a history snapshot; unchanged SKUs would just repeat the last one
+            from history import price_history
+            price_history.append_run(f"monitor_{int(now)}_{uuid.uuid4().hex[:6]}", list(changed.values()))
+        print(f"[MONITOR] Checked {len(due)} SKUs, {len(alerts)} alerts")
+        return alerts
+
+    async def run_forever(self):
+        print(f"[MONITOR] Watching {self.watchlist.stats()}")
+        while True:
+            try:
+                await asyncio.to_thread(self.check_once)
+            except Exception as e:
+                print(f"[ERROR] Monitor tick failed: {e}")
+            await asyncio.sleep(TICK_SECONDS)
+
+
+watchlist = WatchList()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scheduled price monitoring.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    watch = commands.add_parser("watch", help="Add SKUs to the watch list or change their interval")
+    watch.add_argument("products", nargs="*")
+    watch.add_argument("--file", help="Watch every product of an inventory file")
+    watch.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="Seconds between checks")
+    unwatch = commands.add_parser("unwatch", help="Stop watching SKUs")
+    unwatch.add_argument("products", nargs="+")
+    commands.add_parser("status", help="Show watch list size and quota use")
+    commands.add_parser("run", help="Run the scheduler in the foreground")
+    args = parser.parse_args()
+
+    if args.command == "watch":
+        if not (math.isfinite(args.interval) and args.interval > 0):
+            parser.error("--interval must be a positive number of seconds")
+        inventory = {product: None for product in args.products}
+        if args.file:
+            from my_tools import extract_main_file
+            loaded = extract_main_file(args.file)
+            if "error" in loaded:
+                parser.error(loaded["error"])
+            inventory.update(loaded)
+        print(f"[MONITOR] Watching {watchlist.watch(inventory, args.interval)} SKUs every {args.interval:g}s")
+    elif args.command == "unwatch":
+        print(f"[MONITOR] Removed {watchlist.unwatch(args.products)} SKUs")
+    elif args.command == "status":
+        print(watchlist.stats())
+    else:
+        asyncio.run(Monitor(watchlist).run_forever())
+
+
+if __name__ == "__main__":
+    main()
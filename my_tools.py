@@ -1,140 +1,333 @@
-from serpapi import GoogleSearch
 import json
 import openpyxl
-import xlsxwriter
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 import glob
+import re
+from price_engine import fetch_listings, fetch_many, fetched_times
+from price_cache import price_cache
+from pricing import compute_market_stats
+from inventory import iter_inventory, LoadStats
+from sku_state import sku_state, plan_refresh
+from events import emit, current_job
+from checkpoint import checkpoints, current_run
+from history import price_history, NAME_KEYS
+from metrics import timed_tool
+from resilience import raise_if_cancelled
+from compact import encode_batch, chunk_products
+from reports import write_report
+from listings import ListingTable
+from collections import OrderedDict
+import threading
+import uuid
 load_dotenv()
 
-def track_price(product):
-    params = {
-        "engine": "google_shopping",
-        "q": product,
-        "location": "Hyderabad, Telangana, India",
-        "sort_by": "1",
-        "num": "5",
-        "google_domain": "google.com",
-        "hl": "en",
-        "gl": "in",
-        "api_key": os.getenv("SERPAPI_KEY")
-    }
+VERDICT_XLSX = os.getenv("VERDICT_XLSX", "1") == "1"
+# Report files written per run, any of reports.REPORT_FORMATS; VERDICT_XLSX=0 still turns the default off
+VERDICT_FORMATS = [fmt.strip() for fmt in os.getenv("VERDICT_FORMATS", "xlsx" if VERDICT_XLSX else "").split(",")
+                   if fmt.strip()]
+# Add each product's competitor listings to the report
+VERDICT_DETAILS = os.getenv("VERDICT_DETAILS", "0") == "1"
+# Session state key holding the run id whose verdict the analyst should read
+VERDICT_STATE_KEY = "verdict_run_id"
+MAX_VERDICTS_IN_MEMORY = 8
+# Verdicts saved by this process, so the analyst doesn't re-read what was just written
+_verdicts: OrderedDict[str, dict] = OrderedDict()
+_verdicts_lock = threading.Lock()
+# Listings fetched by track_prices but deferred to a follow-up call, per run; they don't depend on the price cache
+_deferred: OrderedDict[str, dict] = OrderedDict()
+_deferred_lock = threading.Lock()
+
+def _fetch_reporter(total: int, start: int = 0, progress_span: tuple[float, float] = (0, 100)):
+    """Builds a fetch_many callback that emits product_fetched events with a running progress %."""
+    done = [start]
+    low, high = progress_span
+
+    def _report(product, result):
+        done[0] += 1
+        emit("product_fetched", product=product, ok=isinstance(result, list),
+             listings=len(result) if isinstance(result, list) else 0,
+             done=done[0], total=total, progress=round(low + (high - low) * done[0] / max(total, 1), 1))
+    return _report
+
+
+def _fetch_checkpointed(products: list[str], force_refresh: bool = False, on_result=None) -> dict:
+    """
+    fetch_many, but when a run is being checkpointed every successful result is recorded
+    and products already fetched by an earlier attempt of the run are not fetched again.
+    """
+    run_id = current_run.get()
+    if run_id is None:
+        return fetch_many(products, force_refresh=force_refresh, on_result=on_result)
+    done = checkpoints.fetched(run_id, products)
+    if done:
+        print(f"[TOOL] Resuming run {run_id}: {len(done)} products already fetched")
+    for product, result in done.items():
+        if on_result:
+            on_result(product, result)
+
+    def _record(product, result):
+        checkpoints.record_fetch(run_id, product, result)
+        if on_result:
+            on_result(product, result)
+
+    todo = [product for product in products if product not in done]
+    fresh = fetch_many(todo, force_refresh=force_refresh, on_result=_record) if todo else {}
+    return {product: done[product] if product in done else fresh[product]
+            for product in dict.fromkeys(products) if product}
+
+
+@timed_tool
+def track_price(product, force_refresh: bool = False):
+    emit("tool_call", tool="track_price", product=product)
     try:
-        search = GoogleSearch(params)
-        results = search.get_dict()
-        shopping_results = results.get("shopping_results", [])
-        cleaned_data = []
-        for item in shopping_results:
-            cleaned_item = {
-                "product_name": item.get("title"),
-                "price_raw" : item.get("price"),
-                "price_numeric": item.get("extracted_price"),
-                "store": item.get("source"),
-                "link": item.get("product_link"),
-                "reviews": item.get("reviews"),
-                "rating": item.get("rating"),
-                "condition": item.get("second_hand_condition", "new")
-            }
-            cleaned_data.append(cleaned_item)
+        cleaned_data = fetch_listings(product, force_refresh=force_refresh)
         if not cleaned_data:
+            emit("product_fetched", product=product, ok=False, listings=0)
             return json.dumps({"error":"no data found"})
-        return json.dumps(cleaned_data, ensure_ascii=False)
+        emit("product_fetched", product=product, ok=True, listings=len(cleaned_data))
+        return encode_batch({product: cleaned_data})[0]
     except Exception as e:
-        return json.dumps({"error": f"SerpApi failed: {str(e)}"})
+        emit("product_fetched", product=product, ok=False, listings=0, error=str(e))
+        return json.dumps({"error": f"Price lookup failed: {str(e)}"})
 
 
-def extract_main_file(file_name: str) -> dict[str, list[str]]:
+@timed_tool
+def track_prices(products: list[str], force_refresh: bool = False) -> str:
     """
-    Extracts the list of product names from the 3rd column of the main Excel file.
+    Fetches competitor prices for a whole list of products in one call.
+    Requests run concurrently, bounded by PRICE_FETCH_CONCURRENCY and SERPAPI_RATE_PER_SEC.
     Args:
-        file_name: The path to the .xlsx file (e.g., "book.xlsx").
+        products: The product names to search for (e.g. the keys returned by 'extract_main_file').
+        force_refresh: Ignore cached results and query the price sources again.
+    Returns a JSON object whose "results" are keyed by product name, in the compact form named by
+    "encoding" ("summary" gives pre-computed market stats per product). Products that did not fit the
+    response token budget are listed under "pending"; call this tool again with them.
+    """
+    print(f"\n[TOOL] Fetching prices for {len(products)} products...")
+    emit("tool_call", tool="track_prices", products=len(products))
+    run_key = current_run.get() or current_job.get() or "default"
+    with _deferred_lock:
+        held = _deferred.get(run_key, {})
+        kept = {} if force_refresh else {product: held.pop(product) for product in products if product in held}
+    todo = [product for product in products if product not in kept]
+    fetched = _fetch_checkpointed(todo, force_refresh=force_refresh,
+                                  on_result=_fetch_reporter(len(products), len(kept))) if todo else {}
+    results = {product: kept[product] if product in kept else fetched[product]
+               for product in dict.fromkeys(products) if product}
+    if kept:
+        print(f"[TOOL] {len(kept)} products served from the previous call's pending results")
+    print(f"[TOOL] Price cache: {price_cache.stats()}")
+    payload, report = encode_batch(results)
+    pending = report.pop("pending_products")
+    if pending:
+        with _deferred_lock:
+            _deferred.setdefault(run_key, {}).update({product: results[product] for product in pending})
+            _deferred.move_to_end(run_key)
+            while len(_deferred) > MAX_VERDICTS_IN_MEMORY:
+                _deferred.popitem(last=False)
+    print(f"[TOOL] Returning {report['products']} products (~{report['tokens']} tokens), {report['pending']} pending")
+    emit("tool_result", tool="track_prices", **report)
+    return payload
+
+
+@timed_tool
+def plan_price_batches(products: list[str]) -> list[list[str]]:
+    """
+    Splits the product list into batches sized so that each 'track_prices' response stays
+    within the tool token budget (TOOL_TOKEN_BUDGET).
+    Args:
+        products: All product names from 'extract_main_file'.
+    """
+    batches = chunk_products(products)
+    print(f"[TOOL] Planned {len(batches)} price batches for {len(products)} products")
+    return batches
+
+
+@timed_tool
+def extract_main_file(file_name: str) -> dict[str, float]:
+    """
+    Extracts the product names and our listing prices from the main inventory file.
+    Args:
+        file_name: The path to the .xlsx, .csv or .parquet file (e.g., "book.xlsx").
     """
     print(f"\n[TOOL] Extracting products from {file_name}...")
+    emit("tool_call", tool="extract_main_file", file_name=file_name)
     try:
-        # Load the workbook using openpyxl
-        main_data = openpyxl.load_workbook(file_name, data_only=True)
-        sheet = main_data.active
-        product_names = []
-        product_prices = ["My Prices"]
-        # Iterate through the 3rd column (C)
-        for namerow in sheet.iter_rows(min_col=1, max_col=1):
-            cell = namerow[0]
-            product_name = cell.value
-            # Filter out empty cells or headers if necessary
-            if product_name and isinstance(product_name, str) and product_name.lower() != "product name":
-                product_names.append(product_name)
-        
-        for namerow in sheet.iter_rows(min_col=2, max_col=2):
-            cell = namerow[0]
-            product_price = cell.value
-            # Filter out empty cells or headers if necessary
-            if product_price and isinstance(product_price, int):
-                product_prices.append(product_price)
-        fin_dict = dict(zip(product_names, product_prices))
-        print(f"[TOOL] Found: {fin_dict}")
-
+        stats = LoadStats()
+        fin_dict = {record.name: record.price for record in iter_inventory(file_name, stats)}
+        print(f"[TOOL] Found {len(fin_dict)} products: {stats.as_dict()}")
+        emit("inventory_loaded", **stats.as_dict())
         return fin_dict
 
     except Exception as e:
-        print(f"[ERROR] Failed to read Excel file: {e}")
+        print(f"[ERROR] Failed to read inventory file: {e}")
         return {"products": [], "error": str(e)}
 
-def save_search(data_json: str) -> dict[str, str]:
+@timed_tool
+def save_search(data_json: str, tool_context=None) -> dict[str, str]:
     """
-    Saves the final calculated product data to a CSV file.
+    Saves the final calculated product data to the price history store and,
+    unless VERDICT_FORMATS is empty, to report files in the 'verdict' folder.
     Args:
         data_json: A JSON string. The agent usually sends a list of objects 
                    like: '[{"Product": "Laptop", "Average Price": 50000}, ...]'
     """
     print(f"\n[TOOL] Saving final report...")
-    now = datetime.now()
-    current_datetime = now.strftime("%Y%m%d_%H%M%S")
-    filename = f"final_market_analysis_{current_datetime}.xlsx"
-
+    emit("tool_call", tool="save_search")
     try:
         data = json.loads(data_json)
-        if isinstance(data, dict):
-            data = list(data.values())[0]
-        if not isinstance(data, list):
-            data = [data]
-
-        if not data:
-            print("[TOOL] Warning: No data to save.")
-            return {"status": "Error", "message": "Data list was empty."}
-
-        # We dynamically get headers from the keys of the first item (e.g., "Product Name", "Average Price")
-        fieldnames = data[0].keys()
-        folder = "verdict"
-        if not os.path.exists(folder):
-            os.mkdir(folder)
-        full_filepath = os.path.join(folder, filename)
-        workbook = xlsxwriter.Workbook(full_filepath)
-        worksheet = workbook.add_worksheet()
-        for col_num, field in enumerate(fieldnames):
-            worksheet.write(0, col_num, field)
-
-        row_num = 1 
-        for row_data in data:
-            for col_num, field in enumerate(fieldnames):
-                worksheet.write(row_num, col_num, row_data.get(field, ""))
-            row_num += 1
-        workbook.close()
-        print(f"[SUCCESS] File saved as '{filename}' with {len(data)} rows.")
-        return {
-            "status": "Success", 
-            "message": f"Successfully saved {len(data)} products to {filename}"
-        }
-
     except json.JSONDecodeError:
         print(f"[ERROR] JSON Decode Failed. Input was: {data_json[:100]}...")
         return {"status": "Error", "message": "Agent provided invalid JSON."}
+    if isinstance(data, dict):
+        data = list(data.values())[0] if data else []
+    if not isinstance(data, list):
+        data = [data]
+    result = save_rows(data)
+    if tool_context is not None and result["status"] == "Success":
+        # Hand the verdict to the analyst through the session instead of the newest file on disk
+        tool_context.state[VERDICT_STATE_KEY] = result["run_id"]
+    return result
+
+
+def save_rows(data: list[dict], details: dict | None = None) -> dict[str, str]:
+    """
+    Writes verdict rows to the history store and the VERDICT_FORMATS report files.
+    `details` ({product: listings} or a ListingTable) adds competitor detail sheets when VERDICT_DETAILS=1.
+    """
+    if not data:
+        print("[TOOL] Warning: No data to save.")
+        return {"status": "Error", "message": "Data list was empty."}
+    now = datetime.now()
+    current_datetime = now.strftime("%Y%m%d_%H%M%S")
+    run_id = current_run.get() or current_job.get() or f"{current_datetime}_{uuid.uuid4().hex[:6]}"
+    try:
+        files = []
+        if VERDICT_FORMATS:
+            # The run id keeps concurrent runs finishing in the same second from overwriting each other
+            name = run_id if run_id.startswith(current_datetime) else f"{current_datetime}_{run_id}"
+            base_path = os.path.join("verdict", "final_market_analysis_" + re.sub(r"[^\w.-]", "_", name))
+            files = write_report(data, base_path, VERDICT_FORMATS, details if VERDICT_DETAILS else None)
+        filename = os.path.basename(files[0]) if files else None
+        price_history.append_run(run_id, data, verdict_file=filename)
+        _remember_verdict(run_id, data)
+        target = ", ".join(os.path.basename(path) for path in files) or f"history run {run_id}"
+        print(f"[SUCCESS] Saved {len(data)} rows to {target}.")
+        emit("verdict_saved", file_name=filename, files=files, run_id=run_id, rows=len(data))
+        return {
+            "status": "Success",
+            "run_id": run_id,
+            "message": f"Successfully saved {len(data)} products to {target}"
+        }
     except Exception as e:
         print(f"[ERROR] File Write Failed: {e}")
         return {"status": "Error", "message": str(e)}
 
 
-def file_to_analyze():
+@timed_tool
+def run_market_analysis(file_name: str = "book.xlsx", force_refresh: bool = False,
+                        incremental: bool = False) -> dict[str, str]:
+    """
+    Runs the whole pricing pipeline without the LLM: loads the inventory, fetches
+    market listings for every product, computes the per-product statistics and saves the verdict.
+    Args:
+        file_name: The path to the inventory .xlsx file (e.g., "book.xlsx").
+        force_refresh: Ignore cached price results.
+        incremental: Only re-price products that are new, changed price, or whose market
+                     data is older than INCREMENTAL_MAX_AGE; reuse the stored verdict rows for the rest.
+    """
+    print(f"\n[TOOL] Running market analysis for {file_name}...")
+    run_id = current_run.get()
+    emit("progress", phase="inventory", progress=0)
+    inventory = extract_main_file(file_name)
+    if "error" in inventory:
+        return {"status": "Error", "message": inventory["error"]}
+
+    # Fetching is the bulk of the run, it gets 5% -> 90% of the progress bar
+    emit("progress", phase="fetching", progress=5)
+    if run_id:
+        checkpoints.set_phase(run_id, "fetching")
+    reusable = {}
+    if incremental and not force_refresh:
+        changed, stale, reusable = plan_refresh(inventory, sku_state.load(list(inventory.keys())))
+        print(f"[TOOL] Incremental run: {len(changed)} new/changed, {len(stale)} stale, {len(reusable)} reused")
+        total = len(changed) + len(stale)
+        listings = _fetch_checkpointed(changed, on_result=_fetch_reporter(total, 0, (5, 90)))
+        listings.update(_fetch_checkpointed(stale, force_refresh=True,
+                                            on_result=_fetch_reporter(total, len(changed), (5, 90))))
+    else:
+        listings = _fetch_checkpointed(list(inventory.keys()), force_refresh=force_refresh,
+                                       on_result=_fetch_reporter(len(inventory), 0, (5, 90)))
+    print(f"[TOOL] Price cache: {price_cache.stats()}")
+    # Nothing is priced or saved for a job cancelled while fetching
+    raise_if_cancelled("Market analysis")
+
+    emit("progress", phase="statistics", progress=90)
+    if run_id:
+        checkpoints.set_phase(run_id, "statistics")
+    # Parsed once into columns, then shared by the statistics and the report's competitor sheets
+    table = ListingTable.from_results(listings, keep_text=VERDICT_DETAILS)
+    refreshed = compute_market_stats({p: price for p, price in inventory.items() if p not in reusable}, table)
+    # Rows priced from cached listings keep the age of those listings, so staleness checks stay honest
+    sku_state.save(inventory, refreshed, fetched_times([row["Product Name"] for row in refreshed]))
+    fresh_rows = {row["Product Name"]: row for row in refreshed}
+    # Keep the inventory order, dropping products that are no longer listed
+    rows = [reusable.get(product) or fresh_rows[product] for product in inventory]
+    emit("progress", phase="saving", progress=95)
+    return save_rows(rows, details=table)
+
+
+def _rows_by_product(rows: list[dict]) -> dict:
+    market_data = {}
+    for row in rows:
+        name_key = next((key for key in NAME_KEYS if row.get(key)), None)
+        if name_key is None:
+            continue
+        market_data[row[name_key]] = {key: value for key, value in row.items() if key != name_key}
+    return market_data
+
+
+def _remember_verdict(run_id: str, rows: list[dict]):
+    with _verdicts_lock:
+        _verdicts[run_id] = _rows_by_product(rows)
+        _verdicts.move_to_end(run_id)
+        while len(_verdicts) > MAX_VERDICTS_IN_MEMORY:
+            _verdicts.popitem(last=False)
+
+
+def load_verdict(run_id: str) -> dict | None:
+    """The verdict of one run: from memory when this process saved it, else from the history store."""
+    with _verdicts_lock:
+        verdict = _verdicts.get(run_id)
+    if verdict is not None:
+        return verdict
+    rows = price_history.run_rows(run_id)
+    return _rows_by_product(rows) if rows else None
+
+
+@timed_tool
+def file_to_analyze(tool_context=None):
+    """
+    Returns the market verdict of the current run, keyed by product name.
+    """
+    # The run id comes from the session state written by save_search (or seeded by main_async),
+    # so overlapping runs each read their own verdict
+    run_id = tool_context.state.get(VERDICT_STATE_KEY) if tool_context is not None else None
+    run_id = run_id or current_run.get() or current_job.get()
+    if run_id:
+        verdict = load_verdict(run_id)
+        if verdict:
+            print(f"[INFO] Processing verdict of run {run_id}")
+            return verdict
+        print(f"[ERROR] No verdict found for run {run_id}")
+        return {"error": f"No verdict found for run {run_id}"}
+
+    run_id = price_history.latest_run_id()
+    if run_id:
+        print(f"[INFO] Processing latest run from history: {run_id}")
+        return load_verdict(run_id)
 
     folder_path = "verdict"
     file_pattern = os.path.join(folder_path, "final_market_analysis_*.xlsx")
@@ -142,7 +335,7 @@ def file_to_analyze():
 
     if not list_of_files:
         print("[ERROR] No analysis files found")
-        exit()
+        return {"error": "No market analysis found, run the pricing pipeline first."}
     latest_file = max(list_of_files, key=os.path.getctime)
     print(f"[INFO] Processing latest file: {latest_file}")
     try:
@@ -174,8 +367,9 @@ def file_to_analyze():
                     row_data[header_name] = cell_value
             market_data[key] = row_data
         return market_data
-    except Exception:
-        print(f"[Error] Met an Exception {Exception}")
+    except Exception as e:
+        print(f"[ERROR] Could not read {latest_file}: {e}")
+        return {"error": f"Could not read {latest_file}: {e}"}
 
 # Archived for sentiment analysis
 # extractor = selectorlib.Extractor.from_yaml_file('selectors.yml')
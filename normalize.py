@@ -0,0 +1,134 @@
+import threading
+import re
+
+# Brands implied by a product line, so "iPhone 15" and "Apple iPhone 15" look the same
+BRAND_ALIASES = {
+    "iphone": "apple", "ipad": "apple", "airpods": "apple", "macbook": "apple", "imac": "apple",
+    "galaxy": "samsung", "pixel": "google", "redmi": "xiaomi", "poco": "xiaomi",
+    "bravia": "sony", "playstation": "sony", "thinkpad": "lenovo", "surface": "microsoft",
+}
+# Spellings that should collapse to one token
+TOKEN_ALIASES = {
+    "one plus": "oneplus", "1+": "oneplus", "i phone": "iphone", "air pods": "airpods",
+}
+# Variant and filler words that don't change what is being priced
+NOISE_WORDS = {
+    "the", "with", "and", "for", "new", "latest", "edition", "version", "smartphone", "phone",
+    "mobile", "unlocked", "dual", "sim", "5g", "4g", "lte", "renewed", "headphones", "earphones", "earbuds",
+    "wireless", "bluetooth", "noise", "cancelling", "canceling",
+    "black", "white", "blue", "green", "red", "pink", "purple", "yellow", "gold", "silver", "grey", "gray",
+    "graphite", "midnight", "starlight", "titanium", "natural", "desert", "obsidian", "porcelain", "hazel",
+    "mint", "lavender", "cream", "violet", "onyx", "phantom", "navy", "jet",
+}
+# Model tiers: "Pro" and "Pro Max" are different products, so these must match exactly
+MODIFIER_WORDS = {"pro", "max", "ultra", "plus", "mini", "lite", "fe", "air", "se", "neo", "prime", "fold", "flip"}
+STORAGE_RE = re.compile(r"\b(\d+(?:\.\d+)?)\s*(gb|tb|mb)\b")
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:\+)?")
+# Model codes, CPUs and sizes ("s9", "i7", "wh1000xm5", "45mm"): any token mixing letters and digits
+MIXED_RE = re.compile(r"(?=.*[a-z])(?=.*[0-9])")
+# Product-type and marketing words a fuzzy match may differ in; any other missing word blocks it
+GENERIC_WORDS = {
+    "tablet", "laptop", "notebook", "smartwatch", "speaker", "console", "camera", "tv", "television",
+    "display", "screen", "inch", "official", "original", "genuine", "brand", "international", "model",
+    "over", "ear", "in", "true",
+}
+FUZZY_THRESHOLD = 0.75
+# Queries remembered by a QueryIndex before it starts over, so a long-running process stays bounded
+QUERY_INDEX_SIZE = 10000
+
+
+def tokenize(query: str) -> tuple[frozenset, frozenset]:
+    """
+    Splits a product query into (model tokens, spec tokens). Spec tokens are numbers,
+    storage sizes, model tiers and letter+digit codes; two queries only match when those are identical.
+    """
+    text = " " + str(query).lower() + " "
+    # Model codes are written with and without hyphens: "WH-1000XM5" / "WH1000XM5"
+    text = re.sub(r"(?<=[a-z0-9])-(?=[a-z0-9])", "", text)
+    for alias, canonical in TOKEN_ALIASES.items():
+        text = text.replace(f" {alias} ", f" {canonical} ")
+    specs = set()
+    for amount, unit in STORAGE_RE.findall(text):
+        size = float(amount) * (1024 if unit == "tb" else 1)
+        specs.add(f"{size:g}gb")
+    text = STORAGE_RE.sub(" ", text)
+    words, numbers = set(), set()
+    for token in TOKEN_RE.findall(text):
+        if token in NOISE_WORDS:
+            continue
+        is_spec = token.isdigit() or token in MODIFIER_WORDS or MIXED_RE.match(token)
+        (numbers if is_spec else words).add(token)
+    for token in list(words):
+        if token in BRAND_ALIASES:
+            words.add(BRAND_ALIASES[token])
+    return frozenset(words), frozenset(specs | numbers)
+
+
+def canonical_key(query: str) -> str:
+    words, specs = tokenize(query)
+    return " ".join(sorted(words)) + " | " + " ".join(sorted(specs))
+
+
+class QueryIndex:
+    """
+    Clusters equivalent product queries. Exact canonical keys match directly; otherwise
+    an inverted token index finds candidates with the same specs and a word Jaccard
+    similarity above the threshold that differ only in GENERIC_WORDS. The first query of a
+    cluster is its representative. After `max_queries` distinct keys the index starts over.
+    """
+    def __init__(self, threshold: float = FUZZY_THRESHOLD, max_queries: int = QUERY_INDEX_SIZE):
+        self.threshold = threshold
+        self.max_queries = max_queries
+        self._by_key: dict[str, str] = {}
+        self._clusters: dict[str, tuple[frozenset, frozenset]] = {}
+        self._by_token: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def representative(self, query: str) -> str:
+        key = canonical_key(query)
+        with self._lock:
+            if key in self._by_key:
+                return self._by_key[key]
+            if len(self._by_key) >= self.max_queries:
+                self._by_key.clear()
+                self._clusters.clear()
+                self._by_token.clear()
+            words, specs = tokenize(query)
+            match = self._best_match(words, specs)
+            if match is None:
+                match = query
+                self._clusters[query] = (words, specs)
+                for token in words:
+                    self._by_token.setdefault(token, set()).add(query)
+            self._by_key[key] = match
+            return match
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def _best_match(self, words: frozenset, specs: frozenset) -> str | None:
+        if not words:
+            return None
+        candidates = set()
+        for token in words:
+            candidates |= self._by_token.get(token, set())
+        best, best_score = None, self.threshold
+        for candidate in candidates:
+            other_words, other_specs = self._clusters[candidate]
+            # "GPS" vs "GPS Cellular" are different products even when most words agree
+            if other_specs != specs or (words ^ other_words) - GENERIC_WORDS:
+                continue
+            score = len(words & other_words) / len(words | other_words)
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+
+def group_queries(products: list[str], index: QueryIndex | None = None) -> dict[str, list[str]]:
+    """Maps each representative query to the raw product strings it stands for, in input order."""
+    index = index or QueryIndex()
+    groups: dict[str, list[str]] = {}
+    for product in products:
+        if product:
+            groups.setdefault(index.representative(product), []).append(product)
+    return groups
@@ -0,0 +1,133 @@
+import sqlite3
+import threading
+import json
+import time
+import os
+from metrics import CACHE_LOOKUPS, observe_job
+from normalize import canonical_key
+from dotenv import load_dotenv
+load_dotenv()
+
+CACHE_PATH = os.getenv("PRICE_CACHE_PATH", os.path.join("cache", "price_cache.sqlite"))
+CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", str(6 * 60 * 60)))  # seconds, 0 disables the cache
+CACHE_MAX_ENTRIES = int(os.getenv("PRICE_CACHE_MAX_ENTRIES", "50000"))
+
+# Only the params that change what Google Shopping returns are part of the key;
+# the query itself is reduced to its canonical form so equivalent names share an entry
+KEY_PARAMS = ("engine", "location", "gl", "hl", "num", "sort_by")
+
+
+def cache_key(params: dict) -> str:
+    parts = [canonical_key(params.get("q", ""))]
+    parts += [f"{name}={params.get(name, '')}" for name in KEY_PARAMS]
+    if params.get("sources"):
+        # Results merged from several price sources aren't interchangeable with SerpApi-only ones
+        parts.append(f"sources={params['sources']}")
+    return "|".join(parts)
+
+
+class PriceCache:
+    """
+    Disk-backed TTL cache for cleaned shopping results, with LRU eviction
+    once more than max_entries are stored. Safe to share between threads,
+    and between processes through SQLite's own locking.
+    """
+    def __init__(self, path: str = CACHE_PATH, ttl: float = CACHE_TTL, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, payload TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_accessed ON results(accessed_at)")
+            self._conn.commit()
+        return self._conn
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get(self, params: dict):
+        """Returns the cached listings for these params, or None on a miss/expired entry."""
+        if not self.enabled:
+            return None
+        key = cache_key(params)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT payload, created_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(result="miss")
+                observe_job("price_cache_miss", 0)
+                return None
+            conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+        CACHE_LOOKUPS.inc(result="hit")
+        observe_job("price_cache_hit", 0)
+        return json.loads(row[0])
+
+    def fetched_at(self, params: dict) -> float | None:
+        """When the fresh entry for these params was fetched, or None when there is none."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._connect().execute("SELECT created_at FROM results WHERE key = ?", (cache_key(params),)).fetchone()
+        if row is None or time.time() - row[0] > self.ttl:
+            return None
+        return row[0]
+
+    def set(self, params: dict, listings: list[dict]):
+        if not self.enabled:
+            return
+        now = time.time()
+        payload = json.dumps(listings, ensure_ascii=False)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, payload, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (cache_key(params), payload, now, now)
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection):
+        count = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            conn = self._connect()
+            deleted = conn.execute("DELETE FROM results WHERE created_at < ?", (time.time() - self.ttl,)).rowcount
+            conn.commit()
+        return deleted
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+price_cache = PriceCache()
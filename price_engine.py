@@ -0,0 +1,204 @@
+from serpapi import GoogleSearch
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+import threading
+import contextvars
+import time
+import re
+import os
+from price_cache import price_cache, PriceCache, cache_key
+from resilience import RateLimiter, AdaptiveRateLimiter, Upstream, UpstreamError, cancel_signal
+from normalize import QueryIndex, group_queries
+from metrics import SERPAPI_SECONDS, SERPAPI_REQUESTS, COALESCED, observe_job
+from sources import fetch_from_sources, sources_key
+from dotenv import load_dotenv
+load_dotenv()
+
+# Tunables, overridable from .env
+MAX_CONCURRENCY = int(os.getenv("PRICE_FETCH_CONCURRENCY", "8"))
+REQUESTS_PER_SECOND = float(os.getenv("SERPAPI_RATE_PER_SEC", "5"))
+SERPAPI_TIMEOUT = float(os.getenv("SERPAPI_TIMEOUT", "30"))
+# SerpApi error messages that mean "slow down" when the HTTP status doesn't say so
+THROTTLE_RE = re.compile(r"rate limit|too many requests|hourly searches", re.IGNORECASE)
+# Point this at a local stub server (e.g. "http://127.0.0.1:8765") for offline testing
+SERPAPI_BACKEND = os.getenv("SERPAPI_BACKEND", "")
+
+DEFAULT_PARAMS = {
+    "engine": "google_shopping",
+    "location": "Hyderabad, Telangana, India",
+    "sort_by": "1",
+    "num": "5",
+    "google_domain": "google.com",
+    "hl": "en",
+    "gl": "in",
+}
+
+
+# Adapts below SERPAPI_RATE_PER_SEC when SerpApi starts answering 429s
+rate_limiter = AdaptiveRateLimiter("serpapi", REQUESTS_PER_SECOND)
+serpapi = Upstream("serpapi", rate_limiter)
+# Shared across calls so equivalent names keep mapping to the same search; bounded by QUERY_INDEX_SIZE
+query_index = QueryIndex()
+_inflight: dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def build_params(product: str, api_key: str | None = None) -> dict:
+    params = dict(DEFAULT_PARAMS)
+    params["q"] = product
+    params["api_key"] = api_key or os.getenv("SERPAPI_KEY")
+    return params
+
+
+def clean_results(results: dict) -> list[dict]:
+    cleaned_data = []
+    for item in results.get("shopping_results", []):
+        cleaned_data.append({
+            "product_name": item.get("title"),
+            "price_raw": item.get("price"),
+            "price_numeric": item.get("extracted_price"),
+            "store": item.get("source"),
+            "link": item.get("product_link"),
+            "reviews": item.get("reviews"),
+            "rating": item.get("rating"),
+            "condition": item.get("second_hand_condition", "new")
+        })
+    return cleaned_data
+
+
+def _search_once(params: dict) -> list[dict]:
+    search = GoogleSearch(params)
+    search.timeout = SERPAPI_TIMEOUT
+    if SERPAPI_BACKEND:
+        search.BACKEND = SERPAPI_BACKEND
+    search.params_dict["output"] = "json"
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        # Read the response ourselves: get_dict() hides the HTTP status we need to tell 429s from bad queries
+        response = search.get_response()
+        try:
+            results = response.json()
+        except ValueError:
+            raise UpstreamError(f"SerpApi returned HTTP {response.status_code}", status=response.status_code)
+        if "error" in results and not results.get("shopping_results"):
+            message = results["error"]
+            status = response.status_code if response.status_code >= 400 else None
+            if status is None and THROTTLE_RE.search(message):
+                status = 429
+            raise UpstreamError(message, status=status)
+        listings = clean_results(results)
+        outcome = "ok" if listings else "empty"
+    finally:
+        elapsed = time.perf_counter() - started
+        SERPAPI_SECONDS.observe(elapsed)
+        SERPAPI_REQUESTS.inc(outcome=outcome)
+        observe_job("serpapi", elapsed)
+    return listings
+
+
+def _request_listings(params: dict, limiter: RateLimiter) -> list[dict]:
+    """One SerpApi search behind the adaptive limiter, jittered retries and the circuit breaker."""
+    return serpapi.call(lambda: _search_once(params), params["api_key"] or "default", limiter)
+
+
+def fetch_listings(product: str, api_key: str | None = None, limiter: RateLimiter = rate_limiter,
+                   force_refresh: bool = False, cache: PriceCache = price_cache) -> list[dict]:
+    """
+    Queries the configured price sources (SerpApi by default, see sources.py) and returns
+    the cleaned listings. Served from the local cache when a fresh entry exists, unless
+    force_refresh is set. Concurrent calls for an equivalent query share a single in-flight request.
+    Raises RuntimeError when no source returned a result.
+    """
+    params = build_params(product, api_key)
+    params["sources"] = sources_key()
+    if not force_refresh:
+        cached = cache.get(params)
+        if cached is not None:
+            return cached
+    key = cache_key(params)
+    with _inflight_lock:
+        pending = _inflight.get(key)
+        if pending is None:
+            pending = _inflight[key] = Future()
+            owner = True
+        else:
+            owner = False
+    if not owner:
+        COALESCED.inc()
+        return pending.result()
+    try:
+        listings = fetch_from_sources(product, api_key, limiter)
+        if listings:
+            cache.set(params, listings)
+        pending.set_result(listings)
+        return listings
+    except Exception as e:
+        pending.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def fetched_times(products: list[str], cache: PriceCache = price_cache) -> dict[str, float]:
+    """
+    When the listings served for each product were actually fetched, read from the cache entry
+    of the search fetch_many used for it. Products without a cache entry are left out.
+    """
+    times = {}
+    for product in dict.fromkeys(p for p in products if p):
+        params = build_params(query_index.representative(product))
+        params["sources"] = sources_key()
+        fetched_at = cache.fetched_at(params)
+        if fetched_at is not None:
+            times[product] = fetched_at
+    return times
+
+
+def fetch_many(products: list[str], max_workers: int = MAX_CONCURRENCY,
+               api_keys: list[str] | None = None, limiter: RateLimiter = rate_limiter,
+               force_refresh: bool = False, on_result=None, dedupe: bool = True) -> dict[str, dict | list]:
+    """
+    Fetches listings for many products concurrently.
+    Args:
+        products: Product queries, duplicates are fetched once.
+        max_workers: Upper bound on in-flight SerpApi requests.
+        api_keys: Optional pool of keys, assigned round-robin; each key gets its own rate bucket.
+        force_refresh: Skip the result cache and always query the price sources.
+        on_result: Optional callback(product, result), called in the caller's thread as each product completes.
+        dedupe: Collapse equivalent queries ("iPhone 15 128GB Black" / "Apple iPhone 15 (128 GB) - Black")
+                into one request and fan the result back to each of them.
+    Returns a dict keyed by product with either the listings or {"error": ...}.
+    """
+    unique = list(dict.fromkeys(p for p in products if p))
+    groups = group_queries(unique, query_index) if dedupe else {p: [p] for p in unique}
+    keys = api_keys or [os.getenv("SERPAPI_KEY")]
+    cancel = cancel_signal.get()
+
+    def _one(index_query):
+        index, query = index_query
+        # A cancelled job stops between products; the caller checks the signal before using the results
+        if cancel is not None and cancel.is_set():
+            return query, {"error": "Price lookup cancelled"}
+        try:
+            listings = fetch_listings(query, keys[index % len(keys)], limiter, force_refresh)
+            return query, listings if listings else {"error": "no data found"}
+        except Exception as e:
+            return query, {"error": f"Price lookup failed: {str(e)}"}
+
+    if not unique:
+        return {}
+    if len(groups) < len(unique):
+        print(f"[TOOL] Deduplicated {len(unique)} products into {len(groups)} searches")
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(groups)))) as pool:
+        # Each worker runs in a copy of our context so events and metrics stay tied to the caller's job
+        futures = [pool.submit(contextvars.copy_context().run, _one, item) for item in enumerate(groups)]
+        for future in as_completed(futures):
+            query, result = future.result()
+            for product in groups[query]:
+                results[product] = result
+                if on_result:
+                    on_result(product, result)
+    # Keep the caller's ordering
+    return {product: results[product] for product in unique}
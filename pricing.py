@@ -0,0 +1,154 @@
+import numpy as np
+import re
+
+# Listings whose title or condition match these are not comparable to a new retail unit
+EXCLUDED_KEYWORDS = ("refurbished", "renewed", "used", "pre-owned", "open box", "emi")
+OUTLIER_METHODS = ("iqr", "mad")
+IQR_FACTOR = 1.5
+MAD_THRESHOLD = 3.5
+
+
+def parse_price(value):
+    """Turns 1299, "1,299.00" or "₹1,299" into a float, or None when there is no number."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r"\d[\d,]*(?:\.\d+)?", str(value))
+    if not match:
+        return None
+    return float(match.group(0).replace(",", ""))
+
+
+def is_comparable(listing: dict) -> bool:
+    condition = str(listing.get("condition") or "new").lower()
+    if condition != "new":
+        return False
+    title = str(listing.get("product_name") or "").lower()
+    return not any(re.search(rf"\b{re.escape(word)}\b", title) for word in EXCLUDED_KEYWORDS)
+
+
+def _group_quantile(values: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float) -> np.ndarray:
+    """
+    Linear-interpolated quantile for every group of a group-sorted array
+    (values sorted by group, then ascending within the group).
+    """
+    pos = starts + (counts - 1) * q
+    low = np.floor(pos).astype(np.int64)
+    high = np.minimum(low + 1, starts + counts - 1)
+    frac = pos - low
+    return values[low] * (1 - frac) + values[high] * frac
+
+
+def _sort_groups(groups: np.ndarray, values: np.ndarray, n_groups: int):
+    order = np.lexsort((values, groups))
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return order, counts, starts
+
+
+def _outlier_mask(groups: np.ndarray, prices: np.ndarray, n_groups: int, method: str) -> np.ndarray:
+    """True for the prices that survive outlier removal within their own product."""
+    order, counts, starts = _sort_groups(groups, prices, n_groups)
+    sorted_prices = prices[order]
+    present = counts > 0
+    safe_starts = np.where(present, starts, 0)
+    safe_counts = np.maximum(counts, 1)
+    if method == "iqr":
+        q1 = _group_quantile(sorted_prices, safe_starts, safe_counts, 0.25)
+        q3 = _group_quantile(sorted_prices, safe_starts, safe_counts, 0.75)
+        iqr = q3 - q1
+        return (prices >= (q1 - IQR_FACTOR * iqr)[groups]) & (prices <= (q3 + IQR_FACTOR * iqr)[groups])
+    median = _group_quantile(sorted_prices, safe_starts, safe_counts, 0.5)
+    deviation = np.abs(prices - median[groups])
+    dev_order, _, _ = _sort_groups(groups, deviation, n_groups)
+    mad = _group_quantile(deviation[dev_order], safe_starts, safe_counts, 0.5)
+    # A zero MAD means most listings agree exactly; keep those and drop anything else
+    scaled = np.divide(0.6745 * deviation, mad[groups], out=np.zeros_like(deviation), where=mad[groups] > 0)
+    return np.where(mad[groups] > 0, scaled <= MAD_THRESHOLD, deviation == 0)
+
+
+def price_status(listing_price, market_average) -> str:
+    if market_average is None:
+        return "No Market Data"
+    if listing_price is None:
+        return "Unknown"
+    if listing_price > market_average:
+        return "Overpriced"
+    if listing_price < market_average:
+        return "Underpriced"
+    return "At Market"
+
+
+def compute_market_stats(inventory: dict, listings_by_product: dict, method: str = "iqr") -> list[dict]:
+    """
+    Computes the per-product market table in one vectorized pass over every listing.
+    Args:
+        inventory: {product name: our listing price}, as returned by 'extract_main_file'.
+        listings_by_product: {product name: listings or {"error": ...}}, as returned by 'fetch_many',
+                             or a ListingTable holding the same listings.
+        method: Outlier filter, "iqr" (Tukey fences) or "mad" (modified z-score).
+    Returns one row per inventory product, ready for 'save_search'.
+    """
+    if method not in OUTLIER_METHODS:
+        raise ValueError(f"Unknown outlier method '{method}', expected one of {OUTLIER_METHODS}")
+    from listings import ListingTable
+    products = [name for name in inventory if name]
+    n = len(products)
+    table = listings_by_product if isinstance(listings_by_product, ListingTable) else \
+        ListingTable.from_results({p: listings_by_product.get(p) for p in products}, keep_text=False)
+
+    columns = table.numpy()
+    # Map the table's product ids onto inventory positions; listings for other products are ignored
+    positions = {product: gid for gid, product in enumerate(products)}
+    to_group = np.array([positions.get(product, -1) for product in table.products], dtype=np.int64)
+    groups = to_group[columns["product_id"]] if len(table) else np.zeros(0, dtype=np.int64)
+    prices = columns["price"]
+    usable = (groups >= 0) & columns["comparable"] & (prices > 0)
+    groups, prices = groups[usable], prices[usable]
+    reviews, ratings = columns["reviews"][usable], columns["rating"][usable]
+
+    if len(prices):
+        keep = _outlier_mask(groups, prices, n, method)
+        groups, prices, reviews, ratings = groups[keep], prices[keep], reviews[keep], ratings[keep]
+
+    counts = np.bincount(groups, minlength=n)
+    mean = np.divide(np.bincount(groups, weights=prices, minlength=n), counts,
+                     out=np.full(n, np.nan), where=counts > 0)
+    order, _, starts = _sort_groups(groups, prices, n)
+    sorted_prices = prices[order]
+    present = counts > 0
+    median = np.full(n, np.nan)
+    low = np.full(n, np.nan)
+    high = np.full(n, np.nan)
+    if present.any():
+        median[present] = _group_quantile(sorted_prices, starts[present], counts[present], 0.5)
+        low[present] = sorted_prices[starts[present]]
+        high[present] = sorted_prices[starts[present] + counts[present] - 1]
+    max_reviews = np.zeros(n)
+    np.maximum.at(max_reviews, groups, reviews)
+    rated = ~np.isnan(ratings)
+    rating_counts = np.bincount(groups[rated], minlength=n)
+    mean_rating = np.divide(np.bincount(groups[rated], weights=ratings[rated], minlength=n), rating_counts,
+                            out=np.full(n, np.nan), where=rating_counts > 0)
+
+    def _num(value, digits=2):
+        return None if np.isnan(value) else round(float(value), digits)
+
+    rows = []
+    for gid, product in enumerate(products):
+        listing_price = parse_price(inventory[product])
+        market_average = _num(mean[gid])
+        rows.append({
+            "Product Name": product,
+            "Original Listing Price": listing_price,
+            "Market Average Price": market_average,
+            "Market Median Price": _num(median[gid]),
+            "Market Min Price": _num(low[gid]),
+            "Market Max Price": _num(high[gid]),
+            "Status": price_status(listing_price, market_average),
+            "Maximum Number of reviews": int(max_reviews[gid]),
+            "Average of all ratings": _num(mean_rating[gid]),
+            "Listings Used": int(counts[gid]),
+        })
+    return rows
@@ -0,0 +1,220 @@
+import itertools
+import json
+import math
+import csv
+import re
+import os
+import xlsxwriter
+from dotenv import load_dotenv
+load_dotenv()
+
+REPORT_FORMATS = ("xlsx", "csv", "jsonl", "parquet")
+# Above this many products the competitor listings go to one long sheet instead of a sheet each
+MAX_DETAIL_SHEETS = int(os.getenv("VERDICT_MAX_DETAIL_SHEETS", "50"))
+BATCH_SIZE = 10000
+DETAIL_FIELDS = ["Product", "product_name", "price_numeric", "price_raw", "store", "condition",
+                 "rating", "reviews", "source", "link", "Comparable"]
+EXCEL_MAX_ROWS = 1048576
+
+
+def union_fields(rows: list[dict], first: list[str] | None = None) -> list[str]:
+    """Every key used by any row, in first-seen order, so sparse columns aren't dropped."""
+    fields = dict.fromkeys(first or [])
+    for row in rows:
+        for key in row:
+            if key not in fields:
+                fields[key] = None
+    return list(fields)
+
+
+def _finite(value):
+    """NaN and infinity (statistics over no listings) become None: an empty cell, or null in JSON."""
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def _scalar(value):
+    if value is None or isinstance(value, (str, int, bool)):
+        return value
+    if isinstance(value, float):
+        return _finite(value)
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def detail_rows(listings_by_product) -> list[dict]:
+    """Flattens {product: listings} or a ListingTable into one row per competitor listing."""
+    from pricing import is_comparable
+    from listings import ListingTable
+    if isinstance(listings_by_product, ListingTable):
+        return [{"Product": product, **listing, "Comparable": comparable}
+                for product, listing, comparable in listings_by_product.rows()]
+    rows = []
+    for product, listings in listings_by_product.items():
+        if not isinstance(listings, list):
+            continue
+        for listing in listings:
+            rows.append({"Product": product, **listing, "Comparable": is_comparable(listing)})
+    return rows
+
+
+def _sheet_name(index: int, product: str, used: set) -> str:
+    name = re.sub(r"[\[\]:*?/\\]", " ", f"{index} {product}")[:31].strip("' ")
+    while name.lower() in used:
+        name = name[:-1]
+    used.add(name.lower())
+    return name
+
+
+def _write_sheet(worksheet, fields: list[str], rows) -> int:
+    """Writes up to EXCEL_MAX_ROWS - 1 rows from the `rows` iterator and returns how many it took."""
+    # constant_memory flushes each row once the next starts, so rows must go top to bottom
+    worksheet.write_row(0, 0, fields)
+    # Call the typed writers directly: worksheet.write() re-detects numbers, formulas and URLs in every string
+    write_string, write_number, write_boolean = worksheet.write_string, worksheet.write_number, worksheet.write_boolean
+    row_num = 0
+    for row_num, row in enumerate(itertools.islice(rows, EXCEL_MAX_ROWS - 1), start=1):
+        for col_num, field in enumerate(fields):
+            value = row.get(field)
+            if value is None:
+                continue
+            if isinstance(value, bool):
+                write_boolean(row_num, col_num, value)
+            elif isinstance(value, (int, float)):
+                if isinstance(value, float) and not math.isfinite(value):
+                    continue
+                write_number(row_num, col_num, value)
+            else:
+                write_string(row_num, col_num, value if isinstance(value, str) else _scalar(value))
+    worksheet.freeze_panes(1, 0)
+    return row_num
+
+
+def _write_sheets(workbook, name: str, fields: list[str], rows: list[dict], used: set):
+    """Writes rows to `name`, spilling into "name (2)", "name (3)"... past Excel's row limit."""
+    remaining = iter(rows)
+    _write_sheet(workbook.add_worksheet(name), fields, remaining)
+    part = 1
+    while len(rows) > part * (EXCEL_MAX_ROWS - 1):
+        part += 1
+        suffix = f" ({part})"
+        spill = name[:31 - len(suffix)] + suffix
+        used.add(spill.lower())
+        _write_sheet(workbook.add_worksheet(spill), fields, remaining)
+    if part > 1:
+        print(f"[INFO] {len(rows)} rows exceed Excel's sheet limit, '{name}' continues on {part - 1} more sheet(s)")
+
+
+def write_xlsx(path: str, rows: list[dict], fields: list[str], details: list[dict] | None = None):
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_urls": False})
+    try:
+        used = {"verdict"}
+        _write_sheets(workbook, "Verdict", fields, rows, used)
+        if details:
+            detail_fields = union_fields(details, DETAIL_FIELDS)
+            by_product = {}
+            for row in details:
+                by_product.setdefault(row["Product"], []).append(row)
+            if len(by_product) <= MAX_DETAIL_SHEETS:
+                for index, (product, product_rows) in enumerate(by_product.items(), start=1):
+                    _write_sheets(workbook, _sheet_name(index, product, used), detail_fields, product_rows, used)
+            else:
+                used.add("competitors")
+                _write_sheets(workbook, "Competitors", detail_fields, details, used)
+    finally:
+        workbook.close()
+
+
+def write_csv(path: str, rows: list[dict], fields: list[str]):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        for start in range(0, len(rows), BATCH_SIZE):
+            writer.writerows([[_scalar(row.get(field)) for field in fields] for row in rows[start:start + BATCH_SIZE]])
+
+
+def write_jsonl(path: str, rows: list[dict], fields: list[str]):
+    with open(path, "w", encoding="utf-8") as f:
+        for start in range(0, len(rows), BATCH_SIZE):
+            f.write("".join(json.dumps({key: _finite(value) for key, value in row.items()},
+                                       ensure_ascii=False, default=str) + "\n"
+                            for row in rows[start:start + BATCH_SIZE]))
+
+
+def _arrow_type(pa, rows: list[dict], field: str):
+    kinds = set()
+    for row in rows:
+        value = row.get(field)
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            continue
+        kinds.add(type(value) if isinstance(value, (bool, int, float)) else str)
+    if kinds == {bool}:
+        return pa.bool_()
+    if kinds == {int}:
+        return pa.int64()
+    if kinds and kinds <= {int, float}:
+        return pa.float64()
+    return pa.string()
+
+
+def write_parquet(path: str, rows: list[dict], fields: list[str]):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Writing Parquet reports needs pyarrow: pip install pyarrow")
+    # One schema for the whole file; columns holding mixed types are stored as text
+    schema = pa.schema([(field, _arrow_type(pa, rows, field)) for field in fields])
+    with pq.ParquetWriter(path, schema) as writer:
+        for start in range(0, len(rows), BATCH_SIZE):
+            batch = rows[start:start + BATCH_SIZE]
+            columns = {}
+            for field in fields:
+                kind = schema.field(field).type
+                values = [row.get(field) for row in batch]
+                if kind == pa.string():
+                    values = [None if value is None else str(_scalar(value)) for value in values]
+                elif kind == pa.float64():
+                    values = [None if value is None else _finite(float(value)) for value in values]
+                elif kind == pa.int64():
+                    values = [None if value is None or value != value else int(value) for value in values]
+                columns[field] = values
+            writer.write_table(pa.table(columns, schema=schema))
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "parquet": write_parquet}
+
+
+def write_report(rows: list[dict], base_path: str, formats: list[str] = ("xlsx",),
+                 details=None) -> list[str]:
+    """
+    Writes the verdict rows in every requested format and returns the file paths.
+    Args:
+        rows: Verdict rows; columns are the union of all their keys.
+        base_path: Output path without extension, e.g. "verdict/final_market_analysis_20250101_120000_<run id>".
+        formats: Any of REPORT_FORMATS.
+        details: Optional {product: listings} or ListingTable. Added to the workbook as competitor sheets, and
+                 written next to the other formats as "<base>_competitors.<ext>".
+    """
+    unknown = [fmt for fmt in formats if fmt not in REPORT_FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown report format(s) {unknown}, expected any of {REPORT_FORMATS}")
+    folder = os.path.dirname(base_path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    fields = union_fields(rows)
+    flat_details = detail_rows(details) if details else None
+    written = []
+    for fmt in formats:
+        path = f"{base_path}.{fmt}"
+        if fmt == "xlsx":
+            write_xlsx(path, rows, fields, flat_details)
+            written.append(path)
+            continue
+        WRITERS[fmt](path, rows, fields)
+        written.append(path)
+        if flat_details:
+            detail_path = f"{base_path}_competitors.{fmt}"
+            WRITERS[fmt](detail_path, flat_details, union_fields(flat_details, DETAIL_FIELDS))
+            written.append(detail_path)
+    return written
@@ -0,0 +1,387 @@
+"""
+Shared protection for upstream APIs (SerpApi, Gemini).
+
+- RateLimiter: token bucket, one bucket per key (usually the API key).
+- AdaptiveRateLimiter: the same bucket, but its rate halves when the upstream throttles (429)
+  and creeps back up on every success, so throughput settles at what the quota actually allows.
+- RetryPolicy: full-jitter exponential backoff bounded by a total time budget per call.
+- CircuitBreaker: stops calling an upstream that keeps failing, probes it again after a cool-down.
+- Upstream: the three combined around a call.
+
+State changes (rate cuts, circuit opening and closing) are published as `resilience` events on the
+job's event bus and logged to stderr, since they usually happen on worker threads.
+"""
+from collections import deque
+import contextvars
+import threading
+import asyncio
+import random
+import time
+import sys
+import os
+from events import emit
+from metrics import RETRIES, THROTTLED, CIRCUIT_OPENED, UPSTREAM_RATE
+from dotenv import load_dotenv
+load_dotenv()
+
+RETRY_ATTEMPTS = int(os.getenv("UPSTREAM_RETRY_ATTEMPTS", "4"))
+# Total seconds one call may spend across all its attempts and backoff sleeps
+RETRY_BUDGET = float(os.getenv("UPSTREAM_RETRY_BUDGET", "30"))
+BREAKER_THRESHOLD = int(os.getenv("UPSTREAM_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET = float(os.getenv("UPSTREAM_BREAKER_RESET", "30"))
+
+RETRYABLE_STATUS = (500, 502, 503, 504)
+# Bad key or exhausted quota: retrying won't help, but they count towards opening the circuit
+FATAL_STATUS = (401, 402, 403)
+# Samples of recent requests used to pick a starting rate for an unlimited limiter that gets throttled
+RATE_WINDOW = 30.0
+
+
+class UpstreamError(RuntimeError):
+    """An upstream error with an HTTP-like status, for APIs that report errors in the response body."""
+    def __init__(self, message: str, status: int | None = None, retry_after: float | None = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CallCancelled(RuntimeError):
+    """The caller no longer needs the result (a hedged duplicate lost, the source timed out, or the job was cancelled)."""
+
+
+# Set by whoever gives up on a call; Upstream.call checks it before every attempt and during backoff
+cancel_signal = contextvars.ContextVar("cancel_signal", default=None)
+# How often a CancelSignal's wait looks at its parent
+CANCEL_POLL = 0.25
+
+
+class CancelSignal(threading.Event):
+    """
+    A cancel event that also reads as set once its parent is, so cancelling a job reaches the
+    per-request signals created under it (e.g. by fetch_from_sources for hedged requests).
+    """
+    def __init__(self, parent: threading.Event | None = None):
+        super().__init__()
+        self.parent = parent
+
+    def is_set(self) -> bool:
+        return super().is_set() or (self.parent is not None and self.parent.is_set())
+
+    def wait(self, timeout: float | None = None) -> bool:
+        if self.parent is None:
+            return super().wait(timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.is_set():
+            remaining = CANCEL_POLL if deadline is None else min(CANCEL_POLL, deadline - time.monotonic())
+            if remaining <= 0:
+                return False
+            super().wait(remaining)
+        return True
+
+
+def raise_if_cancelled(what: str):
+    """Raises CallCancelled when the current context's cancel signal is set; used between pipeline steps."""
+    cancel = cancel_signal.get()
+    if cancel is not None and cancel.is_set():
+        raise CallCancelled(f"{what} cancelled")
+
+
+def classify(exc: Exception) -> tuple[bool, bool, bool, float | None]:
+    """Returns (retryable, throttled, fatal, retry_after) for an exception raised by an upstream call."""
+    if isinstance(exc, (CircuitOpenError, CallCancelled)):
+        return False, False, False, None
+    status = getattr(exc, "status", None) or getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    if not isinstance(status, int):
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    retry_after = getattr(exc, "retry_after", None)
+    if status == 429:
+        return True, True, False, retry_after
+    if status in RETRYABLE_STATUS:
+        return True, False, False, retry_after
+    # Connection resets, DNS failures and socket timeouts (requests' errors are OSErrors too)
+    if isinstance(exc, (OSError, TimeoutError)) and not isinstance(status, int):
+        return True, False, False, None
+    return False, False, status in FATAL_STATUS, None
+
+
+class RateLimiter:
+    """
+    Token bucket limiter, one bucket per key (usually the API key) so that
+    several keys can be driven in parallel without sharing a quota.
+    """
+    def __init__(self, rate: float, burst: int | None = None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._buckets: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def _reserve(self, key: str) -> float:
+        """Takes a token and returns 0, or returns how long to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(key, [float(self.burst), now])
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = [tokens - 1, now]
+                return 0.0
+            self._buckets[key] = [tokens, now]
+            return (1 - tokens) / self.rate
+
+    def acquire(self, key: str = "default"):
+        if self.rate <= 0:
+            return
+        while (wait := self._reserve(key)) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, key: str = "default"):
+        if self.rate <= 0:
+            return
+        while (wait := self._reserve(key)) > 0:
+            await asyncio.sleep(wait)
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    AIMD token bucket: the rate is cut by `decrease` on a throttle and grows back by about
+    `increase` requests/s every second of successes, up to `max_rate` (0 = no ceiling). A limiter started with rate 0 is unlimited
+    until the first throttle, which sets its rate from the recently observed request rate.
+    """
+    def __init__(self, name: str, rate: float, burst: int | None = None, max_rate: float | None = None,
+                 min_rate: float = 0.05, decrease: float = 0.5, increase: float = 0.5):
+        super().__init__(rate, burst)
+        self.name = name
+        self.max_rate = rate if max_rate is None else max_rate
+        self.min_rate = min_rate
+        self.decrease = decrease
+        self.increase = increase
+        self._max_burst = self.burst
+        self._recent = deque()
+        self._last_decrease = 0.0
+        UPSTREAM_RATE.set(rate, upstream=name)
+
+    def set_rate(self, rate: float, burst: int | None = None):
+        """Resets both the current rate and its ceiling, e.g. when a quota is split between processes."""
+        with self._lock:
+            self.rate = self.max_rate = rate
+            self.burst = self._max_burst = burst or max(1, int(rate))
+        UPSTREAM_RATE.set(rate, upstream=self.name)
+
+    def _note_request(self):
+        now = time.monotonic()
+        with self._lock:
+            self._recent.append(now)
+            while self._recent and self._recent[0] < now - RATE_WINDOW:
+                self._recent.popleft()
+
+    def acquire(self, key: str = "default"):
+        super().acquire(key)
+        self._note_request()
+
+    async def acquire_async(self, key: str = "default"):
+        await super().acquire_async(key)
+        self._note_request()
+
+    def on_success(self):
+        with self._lock:
+            if self.rate <= 0:
+                return
+            # Each success adds increase/rate, so at `rate` successes a second the rate grows by `increase`/s
+            step = self.increase / max(self.rate, 1.0)
+            self.rate = self.rate + step if not self.max_rate else min(self.max_rate, self.rate + step)
+            self.burst = max(1, min(self._max_burst, int(self.rate)))
+            rate = self.rate
+        UPSTREAM_RATE.set(rate, upstream=self.name)
+
+    def on_throttle(self):
+        now = time.monotonic()
+        with self._lock:
+            # A burst of 429s from requests already in flight counts as one signal
+            if now - self._last_decrease < 1.0:
+                return
+            self._last_decrease = now
+            if self.rate <= 0:
+                observed = len(self._recent) / RATE_WINDOW
+                self.rate = max(self.min_rate, observed * self.decrease)
+            else:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.burst = max(1, min(self.burst, int(self.rate) or 1))
+            # Drop saved-up tokens too, or the bucket keeps bursting at the old rate
+            for bucket in self._buckets.values():
+                bucket[0] = min(bucket[0], 0.0)
+            rate = self.rate
+        print(f"[INFO] {self.name} throttled, rate lowered to {rate:.2f}/s", file=sys.stderr)
+        emit("resilience", upstream=self.name, state="throttled", rate=round(rate, 3))
+        UPSTREAM_RATE.set(rate, upstream=self.name)
+
+
+class RetryPolicy:
+    """Full-jitter exponential backoff; gives up after `attempts` failed tries or once `budget` seconds are spent."""
+    def __init__(self, attempts: int = RETRY_ATTEMPTS, base_delay: float = 0.5, max_delay: float = 8.0,
+                 budget: float = RETRY_BUDGET):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+
+    def next_delay(self, attempt: int, started: float, retry_after: float | None = None,
+                   throttled: bool = False) -> float | None:
+        """
+        Delay before retry number `attempt` (0-based), or None when retrying is not allowed.
+        Throttled calls are only bounded by the budget: the limiter has already slowed down for them.
+        """
+        if attempt + 1 >= self.attempts and not throttled:
+            return None
+        delay = retry_after if retry_after is not None else random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if time.monotonic() - started + delay > self.budget:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures; while open, calls fail fast.
+    After `reset_timeout` one probe call is let through and its outcome closes or re-opens it;
+    a probe that ends without an outcome (cancelled, interrupted) hands the slot back with release_probe.
+    """
+    def __init__(self, name: str, failure_threshold: int = BREAKER_THRESHOLD, reset_timeout: float = BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._probe_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self._opened_at >= self.reset_timeout else "open"
+
+    def before(self) -> int | None:
+        """Raises CircuitOpenError while open; returns a probe id when this call is the half-open probe."""
+        with self._lock:
+            if self._opened_at is None:
+                return None
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                raise CircuitOpenError(f"{self.name} circuit is open after {self._failures} consecutive failures")
+            self._probing = True
+            self._probe_id += 1
+            return self._probe_id
+
+    def release_probe(self, probe: int | None):
+        """Frees the probe slot if that probe ended without recording a success or failure."""
+        if probe is None:
+            return
+        with self._lock:
+            if self._probing and self._probe_id == probe:
+                self._probing = False
+
+    def reset(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            was_open = self._opened_at is not None
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+        if was_open:
+            print(f"[INFO] {self.name} circuit closed", file=sys.stderr)
+            emit("resilience", upstream=self.name, state="circuit_closed")
+
+    def record_failure(self):
+        opened = None
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                if self._opened_at is None:
+                    opened = self._failures
+                self._opened_at = time.monotonic()
+            self._probing = False
+        if opened is not None:
+            CIRCUIT_OPENED.inc(upstream=self.name)
+            print(f"[ERROR] {self.name} circuit opened after {opened} consecutive failures", file=sys.stderr)
+            emit("resilience", upstream=self.name, state="circuit_open", failures=opened)
+
+
+class Upstream:
+    """Rate limiting, retries and circuit breaking for one upstream API."""
+    def __init__(self, name: str, limiter: RateLimiter, retry: RetryPolicy | None = None,
+                 breaker: CircuitBreaker | None = None):
+        self.name = name
+        self.limiter = limiter
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker(name)
+
+    def reset(self):
+        """Back to a closed circuit and the configured rate, e.g. between independent runs in one process."""
+        self.breaker.reset()
+        if isinstance(self.limiter, AdaptiveRateLimiter):
+            self.limiter.set_rate(self.limiter.max_rate)
+
+    def succeeded(self, limiter: RateLimiter | None = None):
+        limiter = limiter or self.limiter
+        if isinstance(limiter, AdaptiveRateLimiter):
+            limiter.on_success()
+        self.breaker.record_success()
+
+    def failed(self, exc: Exception, attempt: int, started: float, limiter: RateLimiter | None = None) -> float | None:
+        """Records a failed attempt; returns the delay before retrying, or None to give up."""
+        limiter = limiter or self.limiter
+        retryable, throttled, fatal, retry_after = classify(exc)
+        if isinstance(exc, (CircuitOpenError, CallCancelled)):
+            return None
+        if throttled:
+            THROTTLED.inc(upstream=self.name)
+            if isinstance(limiter, AdaptiveRateLimiter):
+                limiter.on_throttle()
+        if (retryable and not throttled) or fatal:
+            # Throttling is the limiter's job; only outages and unusable credentials open the circuit
+            self.breaker.record_failure()
+        else:
+            # The upstream answered, the request itself was the problem
+            self.breaker.record_success()
+        if not retryable:
+            return None
+        delay = self.retry.next_delay(attempt, started, retry_after, throttled)
+        if delay is not None:
+            RETRIES.inc(upstream=self.name, reason="throttled" if throttled else "error")
+        return delay
+
+    def call(self, fn, key: str = "default", limiter: RateLimiter | None = None):
+        limiter = limiter or self.limiter
+        cancel = cancel_signal.get()
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            probe = self.breaker.before()
+            try:
+                limiter.acquire(key)
+                if cancel is not None and cancel.is_set():
+                    raise CallCancelled(f"{self.name} call cancelled after {attempt} attempt(s)")
+                result = fn()
+            except Exception as e:
+                delay = self.failed(e, attempt, started, limiter)
+                if delay is None:
+                    raise
+            else:
+                self.succeeded(limiter)
+                return result
+            finally:
+                self.breaker.release_probe(probe)
+            # Wakes early when the call is cancelled during the backoff
+            if cancel is not None and cancel.wait(delay):
+                raise CallCancelled(f"{self.name} call cancelled after {attempt + 1} attempt(s)")
+            if cancel is None:
+                time.sleep(delay)
+            attempt += 1
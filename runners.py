@@ -0,0 +1,70 @@
+from google.adk.runners import Runner
+from google.adk.sessions import DatabaseSessionService
+from contextlib import asynccontextmanager
+import asyncio
+import os
+from jobs import WORKER_COUNT
+from dotenv import load_dotenv
+load_dotenv()
+
+APP_NAME = "price-tracker"
+# Sessions outlive the process so a resumed run continues its conversation
+SESSION_DB_URL = os.getenv("SESSION_DB_URL", "sqlite:///" + os.path.join("cache", "sessions.sqlite"))
+# One warm runner per analysis worker by default
+RUNNER_POOL_SIZE = int(os.getenv("RUNNER_POOL_SIZE", str(WORKER_COUNT)))
+
+_session_service = None
+
+
+def session_service() -> DatabaseSessionService:
+    """Shared persistent session service, created on first use."""
+    global _session_service
+    if _session_service is None:
+        if SESSION_DB_URL.startswith("sqlite:///"):
+            folder = os.path.dirname(SESSION_DB_URL[len("sqlite:///"):])
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder, exist_ok=True)
+        _session_service = DatabaseSessionService(db_url=SESSION_DB_URL)
+    return _session_service
+
+
+class RunnerPool:
+    """
+    Runners for one agent graph, built once and handed out to concurrent jobs.
+    They share the agent (and so its model client and HTTP connections) and the
+    persistent session service; the pool size bounds concurrent runs of the graph.
+    """
+    def __init__(self, agent, size: int = RUNNER_POOL_SIZE, app_name: str = APP_NAME):
+        self.agent = agent
+        self.size = max(1, size)
+        self.app_name = app_name
+        self._idle: asyncio.Queue | None = None
+
+    def warm(self):
+        """Builds the runners; safe to call more than once."""
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            self._idle.put_nowait(Runner(agent=self.agent, app_name=self.app_name, session_service=session_service()))
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.warm()
+        runner = await self._idle.get()
+        try:
+            yield runner
+        finally:
+            self._idle.put_nowait(runner)
+
+
+async def ensure_session(runner: Runner, user_id: str, session_id: str, state: dict | None = None):
+    """Returns the stored session for (user, session id), creating it with `state` on first use."""
+    session = await runner.session_service.get_session(
+        app_name=runner.app_name, user_id=user_id, session_id=session_id
+    )
+    if session is None:
+        session = await runner.session_service.create_session(
+            app_name=runner.app_name, user_id=user_id, session_id=session_id, state=state
+        )
+    return session
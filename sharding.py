@@ -0,0 +1,323 @@
+"""
+Sharded catalog runs.
+
+The inventory is split into N partitions (by name hash or by brand) and each partition is
+priced in its own process. Locally that's a process pool; across hosts, shards go through a
+SQLite work queue on shared storage that any number of workers can drain:
+
+    python sharding.py run --shards 8 --file book.xlsx
+    python sharding.py run --shards 8 --queue /mnt/shared/shards.sqlite --distributed
+    python sharding.py worker --queue /mnt/shared/shards.sqlite
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import argparse
+import sqlite3
+import hashlib
+import socket
+import json
+import time
+import uuid
+import os
+
+PARTITION_MODES = ("hash", "category")
+# A claimed shard whose worker hasn't finished within this many seconds is handed out again
+CLAIM_TIMEOUT = float(os.getenv("SHARD_CLAIM_TIMEOUT", "1800"))
+
+
+def _stable_hash(text: str) -> int:
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def product_category(product: str) -> str:
+    """Brand-level category, e.g. "apple" for "iPhone 17 Pro"; falls back to the first word."""
+    from normalize import tokenize, BRAND_ALIASES
+    words, _ = tokenize(product)
+    brands = sorted(set(BRAND_ALIASES.values()) & words)
+    if brands:
+        return brands[0]
+    first = str(product).lower().split()
+    return first[0] if first else ""
+
+
+def partition(inventory: dict, shards: int, by: str = "hash") -> list[dict]:
+    """Splits {product: price} into `shards` dicts; empty partitions are dropped."""
+    if by not in PARTITION_MODES:
+        raise ValueError(f"Unknown partition mode '{by}', expected one of {PARTITION_MODES}")
+    shards = max(1, shards)
+    parts = [{} for _ in range(shards)]
+    for product, price in inventory.items():
+        key = product_category(product) if by == "category" else product
+        parts[_stable_hash(key) % shards][product] = price
+    return [part for part in parts if part]
+
+
+def price_shard(inventory: dict, force_refresh: bool = False) -> list[dict]:
+    """Fetches and prices one partition; runs inside a worker process."""
+    from price_engine import fetch_many
+    from pricing import compute_market_stats
+    listings = fetch_many(list(inventory.keys()), force_refresh=force_refresh)
+    return compute_market_stats(inventory, listings)
+
+
+def _init_worker(rate: float):
+    # Every process has its own token bucket, split the configured rate between them
+    import price_engine
+    price_engine.rate_limiter.set_rate(rate)
+
+
+class ShardQueue:
+    """
+    Work queue in a single SQLite file. Workers claim shards atomically with
+    BEGIN IMMEDIATE, so any number of processes or hosts sharing the file can drain it.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS shards ("
+                "run_id TEXT NOT NULL, shard_id INTEGER NOT NULL, payload TEXT NOT NULL, "
+                "status TEXT NOT NULL DEFAULT 'pending', worker TEXT, claimed_at REAL, "
+                "result TEXT, error TEXT, PRIMARY KEY (run_id, shard_id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_shards_status ON shards(status, claimed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def enqueue(self, run_id: str, parts: list[dict], force_refresh: bool = False):
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO shards (run_id, shard_id, payload) VALUES (?, ?, ?)",
+                [(run_id, i, json.dumps({"inventory": part, "force_refresh": force_refresh}, ensure_ascii=False))
+                 for i, part in enumerate(parts)]
+            )
+
+    def claim(self, worker: str):
+        """Returns (run_id, shard_id, payload) for the next available shard, or None."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT run_id, shard_id, payload FROM shards WHERE status = 'pending' "
+                "OR (status = 'claimed' AND claimed_at < ?) ORDER BY run_id, shard_id LIMIT 1",
+                (time.time() - CLAIM_TIMEOUT,)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE shards SET status = 'claimed', worker = ?, claimed_at = ? WHERE run_id = ? AND shard_id = ?",
+                    (worker, time.time(), row[0], row[1])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return (row[0], row[1], json.loads(row[2])) if row else None
+
+    def complete(self, run_id: str, shard_id: int, rows: list[dict] | None = None, error: str | None = None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE shards SET status = ?, result = ?, error = ? WHERE run_id = ? AND shard_id = ?",
+                ("failed" if error else "done", json.dumps(rows or [], ensure_ascii=False), error, run_id, shard_id)
+            )
+
+    def release(self, run_id: str, worker: str, error: str | None = None) -> int:
+        """Hands the shards a dead worker had claimed back to the queue, or fails them with `error`."""
+        with self._connect() as conn:
+            if error:
+                cursor = conn.execute(
+                    "UPDATE shards SET status = 'failed', error = ? WHERE run_id = ? AND worker = ? AND status = 'claimed'",
+                    (error, run_id, worker)
+                )
+            else:
+                cursor = conn.execute(
+                    "UPDATE shards SET status = 'pending', worker = NULL, claimed_at = NULL "
+                    "WHERE run_id = ? AND worker = ? AND status = 'claimed'", (run_id, worker)
+                )
+            return cursor.rowcount
+
+    def fail_unfinished(self, run_id: str, error: str) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE shards SET status = 'failed', error = ? WHERE run_id = ? AND status IN ('pending', 'claimed')",
+                (error, run_id)
+            ).rowcount
+
+    def progress(self, run_id: str) -> dict[str, int]:
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM shards WHERE run_id = ? GROUP BY status", (run_id,)))
+
+    def results(self, run_id: str) -> tuple[list[dict], list[str]]:
+        rows, errors = [], []
+        with self._connect() as conn:
+            for result, error in conn.execute(
+                "SELECT result, error FROM shards WHERE run_id = ? ORDER BY shard_id", (run_id,)
+            ):
+                rows.extend(json.loads(result or "[]"))
+                if error:
+                    errors.append(error)
+        return rows, errors
+
+
+def run_worker(queue_path: str, poll_interval: float = 2.0, once: bool = False):
+    """Drains shards from the queue until it's empty (once=True) or forever."""
+    queue = ShardQueue(queue_path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"[SHARD] Worker {worker} polling {queue_path}")
+    while True:
+        claimed = queue.claim(worker)
+        if claimed is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        run_id, shard_id, payload = claimed
+        print(f"[SHARD] {worker} pricing shard {shard_id} of run {run_id} ({len(payload['inventory'])} products)")
+        try:
+            queue.complete(run_id, shard_id, rows=price_shard(payload["inventory"], payload["force_refresh"]))
+        except Exception as e:
+            print(f"[ERROR] Shard {shard_id} of run {run_id} failed: {e}")
+            queue.complete(run_id, shard_id, error=str(e))
+
+
+def _local_worker(queue_path: str, rate: float):
+    _init_worker(rate)
+    run_worker(queue_path, once=True)
+
+
+def run_sharded_analysis(file_name: str = "book.xlsx", shards: int = 4, by: str = "hash",
+                         queue_path: str | None = None, distributed: bool = False,
+                         force_refresh: bool = False, timeout: float | None = None) -> dict[str, str]:
+    """
+    Prices the inventory in `shards` partitions and saves one merged verdict.
+    Args:
+        file_name: Inventory file.
+        shards: Number of partitions, and of local worker processes.
+        by: "hash" (even spread) or "category" (one brand per shard where possible).
+        queue_path: SQLite work queue file. Without it, shards go straight to a local process pool.
+        distributed: Only enqueue and wait; the shards are priced by `sharding.py worker` processes
+                     (on this or other hosts) pointed at the same queue file.
+        timeout: Give up waiting for distributed workers after this many seconds.
+    """
+    from my_tools import extract_main_file, save_rows
+    from price_engine import REQUESTS_PER_SECOND, fetched_times
+    from resilience import cancel_signal, raise_if_cancelled
+    from sku_state import sku_state
+
+    inventory = extract_main_file(file_name)
+    if "error" in inventory:
+        return {"status": "Error", "message": inventory["error"]}
+    parts = partition(inventory, shards, by)
+    print(f"[SHARD] Split {len(inventory)} products into {len(parts)} shards by {by}")
+    rate = REQUESTS_PER_SECOND / max(1, len(parts))
+    # spawn keeps the workers free of the parent's threads, locks and sqlite handles
+    context = multiprocessing.get_context("spawn")
+
+    if queue_path is None:
+        with ProcessPoolExecutor(max_workers=len(parts), mp_context=context,
+                                 initializer=_init_worker, initargs=(rate,)) as pool:
+            shard_rows = list(pool.map(price_shard, parts, [force_refresh] * len(parts)))
+        rows = [row for part_rows in shard_rows for row in part_rows]
+        errors = []
+    else:
+        queue = ShardQueue(queue_path)
+        run_id = uuid.uuid4().hex[:12]
+        queue.enqueue(run_id, parts, force_refresh)
+        workers, exited = [], []
+        # A crashed worker's shards are re-queued onto a replacement this many times per run, then failed
+        restarts_left = len(parts)
+
+        def _start_worker():
+            process = context.Process(target=_local_worker, args=(queue_path, rate))
+            process.start()
+            workers.append(process)
+
+        if not distributed:
+            for _ in parts:
+                _start_worker()
+        started = time.time()
+        while True:
+            for process in [p for p in workers if p.exitcode is not None]:
+                workers.remove(process)
+                exited.append(process)
+                if process.exitcode == 0:
+                    continue
+                worker_id = f"{socket.gethostname()}:{process.pid}"
+                if restarts_left > 0:
+                    restarts_left -= 1
+                    released = queue.release(run_id, worker_id)
+                    print(f"[ERROR] Shard worker {worker_id} exited with code {process.exitcode}, "
+                          f"re-queued {released} shard(s)")
+                    if released:
+                        _start_worker()
+                else:
+                    queue.release(run_id, worker_id, error=f"worker exited with code {process.exitcode}")
+            progress = queue.progress(run_id)
+            finished = progress.get("done", 0) + progress.get("failed", 0)
+            if finished >= len(parts):
+                break
+            if not distributed and not workers:
+                # Workers only exit cleanly once nothing is claimable; re-read in case the last one just finished
+                progress = queue.progress(run_id)
+                if progress.get("done", 0) + progress.get("failed", 0) < len(parts):
+                    queue.fail_unfinished(run_id, "no local shard worker left to price this shard")
+                continue
+            cancel = cancel_signal.get()
+            timed_out = timeout and time.time() - started > timeout
+            if timed_out or (cancel is not None and cancel.is_set()):
+                for process in workers:
+                    process.terminate()
+                for process in workers:
+                    process.join()
+                if not timed_out:
+                    queue.fail_unfinished(run_id, "run cancelled")
+                    raise_if_cancelled("Sharded analysis")
+                return {"status": "Error", "message": f"Timed out waiting for shards: {progress}"}
+            time.sleep(1)
+        for process in workers + exited:
+            process.join()
+        rows, errors = queue.results(run_id)
+
+    for error in errors:
+        print(f"[ERROR] Shard failed: {error}")
+    # Pool workers can't be interrupted mid-shard, but a cancelled run saves nothing
+    raise_if_cancelled("Sharded analysis")
+    sku_state.save(inventory, rows, fetched_times([row["Product Name"] for row in rows]))
+    by_product = {row["Product Name"]: row for row in rows}
+    # Merge back in inventory order
+    merged = [by_product[product] for product in inventory if product in by_product]
+    return save_rows(merged)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded catalog pricing runs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="Split the inventory, price the shards and merge the verdict")
+    run.add_argument("--file", default="book.xlsx")
+    run.add_argument("--shards", type=int, default=os.cpu_count() or 4)
+    run.add_argument("--by", choices=PARTITION_MODES, default="hash")
+    run.add_argument("--queue", help="SQLite work queue file (needed for --distributed)")
+    run.add_argument("--distributed", action="store_true", help="Wait for external workers instead of spawning them")
+    run.add_argument("--force-refresh", action="store_true")
+    run.add_argument("--timeout", type=float)
+    worker = commands.add_parser("worker", help="Price shards from a work queue")
+    worker.add_argument("--queue", required=True)
+    worker.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        run_worker(args.queue, once=args.once)
+        return
+    if args.distributed and not args.queue:
+        parser.error("--distributed needs --queue")
+    print(run_sharded_analysis(args.file, args.shards, args.by, args.queue, args.distributed,
+                               args.force_refresh, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
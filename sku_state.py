@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+import hashlib
+import json
+import time
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+STATE_PATH = os.getenv("SKU_STATE_PATH", os.path.join("cache", "sku_state.sqlite"))
+# Market data older than this (seconds) is re-fetched even when the inventory row is unchanged
+MAX_MARKET_AGE = float(os.getenv("INCREMENTAL_MAX_AGE", str(24 * 60 * 60)))
+
+
+def row_hash(product: str, price) -> str:
+    return hashlib.sha1(f"{product}|{price}".encode("utf-8")).hexdigest()
+
+
+class SkuStateStore:
+    """
+    Remembers, per product, the inventory row we last priced, when its market data
+    was fetched and the verdict row we computed, so unchanged SKUs can be skipped.
+    """
+    def __init__(self, path: str = STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sku_state ("
+                "product TEXT PRIMARY KEY, row_hash TEXT NOT NULL, "
+                "fetched_at REAL NOT NULL, stats TEXT NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def load(self, products: list[str]) -> dict[str, dict]:
+        states = {}
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(products), 500):
+                chunk = products[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for product, hashed, fetched_at, stats in conn.execute(
+                    f"SELECT product, row_hash, fetched_at, stats FROM sku_state WHERE product IN ({placeholders})", chunk
+                ):
+                    states[product] = {"row_hash": hashed, "fetched_at": fetched_at, "stats": json.loads(stats)}
+        return states
+
+    def save(self, inventory: dict, rows: list[dict], fetched_at: float | dict[str, float] | None = None):
+        """
+        Stores the freshly computed verdict rows; rows without market data are not remembered.
+        Args:
+            fetched_at: When the market data was fetched, for all rows or per product. Products
+                        served from the price cache should pass the cache entry's time, not now.
+        """
+        now = time.time()
+        times = fetched_at if isinstance(fetched_at, dict) else {}
+        default = fetched_at if isinstance(fetched_at, (int, float)) else now
+        records = [
+            (row["Product Name"], row_hash(row["Product Name"], inventory.get(row["Product Name"])),
+             times.get(row["Product Name"], default), json.dumps(row, ensure_ascii=False))
+            for row in rows if row.get("Listings Used")
+        ]
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO sku_state (product, row_hash, fetched_at, stats) VALUES (?, ?, ?, ?)", records
+            )
+            conn.commit()
+
+
+def plan_refresh(inventory: dict, states: dict[str, dict], max_age: float = MAX_MARKET_AGE):
+    """
+    Splits the inventory into the products that need work and the verdict rows we can reuse.
+    Returns (changed, stale, reusable_rows): changed products are new or had their
+    listing price edited, stale ones only need their market data refreshed.
+    """
+    now = time.time()
+    changed, stale, reusable = [], [], {}
+    for product, price in inventory.items():
+        state = states.get(product)
+        if state is None or state["row_hash"] != row_hash(product, price):
+            changed.append(product)
+        elif now - state["fetched_at"] > max_age:
+            stale.append(product)
+        else:
+            reusable[product] = state["stats"]
+    return changed, stale, reusable
+
+
+sku_state = SkuStateStore()
@@ -0,0 +1,287 @@
+"""
+Price-source adapters.
+
+Every product query goes to all configured sources in parallel. Each source has its own
+timeout, and a request that runs past the source's usual (p95) latency can be hedged with a
+second identical request; whichever answers first wins and the other is cancelled. Hedging
+is off for SerpApi by default, since every duplicate is a paid search ("hedge": true turns
+it on). Listings from every source that answered in time are merged, so one slow or
+failing source only costs its own listings.
+
+Sources are configured in PRICE_SOURCES_FILE (default sources.json); without it only
+SerpApi is used:
+
+    {"sources": [
+        {"type": "serpapi"},
+        {"type": "http", "name": "partner", "url": "https://api.example.com/search?q={query}",
+         "items": "data.products", "headers": {"Authorization": "Bearer ${PARTNER_TOKEN}"},
+         "fields": {"product_name": "title", "price_numeric": "price", "store": "seller"}},
+        {"type": "file", "name": "fixtures", "path": "fixtures/prices.json"}
+    ]}
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from urllib.parse import quote_plus
+import urllib.request
+import contextvars
+import threading
+import json
+import time
+import os
+from normalize import canonical_key
+from metrics import SOURCE_SECONDS, SOURCE_REQUESTS
+from resilience import CancelSignal, cancel_signal
+from dotenv import load_dotenv
+load_dotenv()
+
+SOURCES_FILE = os.getenv("PRICE_SOURCES_FILE", "sources.json")
+SOURCE_TIMEOUT = float(os.getenv("PRICE_SOURCE_TIMEOUT", "30"))
+# Hedge a request once it has been running longer than this quantile of the source's latency
+HEDGE_QUANTILE = float(os.getenv("PRICE_SOURCE_HEDGE_QUANTILE", "0.95"))
+# Latency samples needed before a source is hedged at all
+MIN_HEDGE_SAMPLES = 20
+SOURCE_POOL_SIZE = int(os.getenv("PRICE_SOURCE_POOL_SIZE", "32"))
+LISTING_FIELDS = ("product_name", "price_raw", "price_numeric", "store", "link", "reviews", "rating", "condition")
+
+_pool = ThreadPoolExecutor(max_workers=SOURCE_POOL_SIZE, thread_name_prefix="price-source")
+
+
+class PriceSource:
+    """
+    Base adapter. Subclasses implement fetch() and return listings in the cleaned
+    shape used everywhere else (see LISTING_FIELDS); raising marks the attempt failed.
+    """
+    def __init__(self, name: str, timeout: float = SOURCE_TIMEOUT, hedge: bool = True,
+                 hedge_after: float | None = None):
+        self.name = name
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    def fetch(self, product: str, api_key: str | None = None, limiter=None) -> list[dict]:
+        raise NotImplementedError
+
+    def timed_fetch(self, product: str, api_key: str | None = None, limiter=None) -> list[dict]:
+        started = time.perf_counter()
+        try:
+            return self.fetch(product, api_key, limiter)
+        finally:
+            elapsed = time.perf_counter() - started
+            SOURCE_SECONDS.observe(elapsed, source=self.name)
+            with self._lock:
+                self._latencies.append(elapsed)
+
+    def hedge_delay(self) -> float | None:
+        """Seconds after which a second request is sent, or None to never hedge."""
+        if not self.hedge:
+            return None
+        if self.hedge_after is not None:
+            return self.hedge_after
+        with self._lock:
+            if len(self._latencies) < MIN_HEDGE_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * HEDGE_QUANTILE))]
+
+
+class SerpApiSource(PriceSource):
+    """Google Shopping through SerpApi, with the shared per-key rate limiter. Not hedged unless asked to."""
+    def __init__(self, name: str = "serpapi", **options):
+        options.setdefault("hedge", False)
+        super().__init__(name, **options)
+
+    def fetch(self, product, api_key=None, limiter=None):
+        from price_engine import build_params, _request_listings, rate_limiter
+        return _request_listings(build_params(product, api_key), limiter or rate_limiter)
+
+
+def _lookup(item, path: str):
+    for part in path.split(".") if path else ():
+        if isinstance(item, dict):
+            item = item.get(part)
+        elif isinstance(item, list) and part.isdigit() and int(part) < len(item):
+            item = item[int(part)]
+        else:
+            return None
+    return item
+
+
+class HttpJsonSource(PriceSource):
+    """
+    Any JSON search API. `url` contains {query}; `items` is the dotted path to the list of
+    results and `fields` maps listing fields to dotted paths inside each result.
+    ${VAR} in headers is read from the environment so tokens stay out of the config file.
+    """
+    def __init__(self, name: str, url: str, items: str = "", fields: dict | None = None,
+                 headers: dict | None = None, **options):
+        super().__init__(name, **options)
+        self.url = url
+        self.items = items
+        self.fields = {field: field for field in LISTING_FIELDS}
+        self.fields.update(fields or {})
+        self.headers = headers or {}
+
+    def fetch(self, product, api_key=None, limiter=None):
+        headers = {key: os.path.expandvars(value) for key, value in self.headers.items()}
+        request = urllib.request.Request(self.url.format(query=quote_plus(product)), headers=headers)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            payload = json.loads(response.read().decode("utf-8"))
+        items = _lookup(payload, self.items)
+        if not isinstance(items, list):
+            raise RuntimeError(f"{self.name}: no result list at '{self.items}'")
+        listings = []
+        for item in items:
+            listing = {field: _lookup(item, path) for field, path in self.fields.items()}
+            listing["condition"] = listing.get("condition") or "new"
+            listings.append(listing)
+        return listings
+
+
+class FileSource(PriceSource):
+    """
+    Listings from a local JSON file of {product query: [listings]}, matched exactly or by
+    canonical key. Useful as a fixture for offline runs and tests, or for feeds dropped on disk.
+    """
+    def __init__(self, name: str = "file", path: str = "", **options):
+        options.setdefault("hedge", False)
+        super().__init__(name, **options)
+        self.path = path
+        self._data = None
+
+    def _load(self) -> dict:
+        if self._data is None:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            self._data = {canonical_key(query): listings for query, listings in raw.items()}
+            self._data.update(raw)
+        return self._data
+
+    def fetch(self, product, api_key=None, limiter=None):
+        data = self._load()
+        listings = data.get(product)
+        if listings is None:
+            listings = data.get(canonical_key(product), [])
+        return [dict(listing) for listing in listings]
+
+
+ADAPTERS = {"serpapi": SerpApiSource, "http": HttpJsonSource, "file": FileSource}
+
+
+def load_sources(path: str = SOURCES_FILE) -> list[PriceSource]:
+    if not path or not os.path.exists(path):
+        return [SerpApiSource()]
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    sources = []
+    for entry in config.get("sources", []):
+        options = dict(entry)
+        kind = options.pop("type", None)
+        if kind not in ADAPTERS:
+            raise ValueError(f"Unknown price source type '{kind}' in {path}, expected one of {tuple(ADAPTERS)}")
+        sources.append(ADAPTERS[kind](**options))
+    return sources or [SerpApiSource()]
+
+
+active_sources = load_sources()
+
+
+def sources_key(sources: list[PriceSource] | None = None) -> str:
+    """Identifies the source set in cache keys; empty for the default SerpApi-only setup."""
+    names = [source.name for source in (sources or active_sources)]
+    return "" if names == ["serpapi"] else ",".join(sorted(names))
+
+
+def shutdown():
+    """Stops the shared source pool; requests still running are left to finish without a caller."""
+    _pool.shutdown(wait=False, cancel_futures=True)
+
+
+def fetch_from_sources(product: str, api_key: str | None = None, limiter=None,
+                       sources: list[PriceSource] | None = None) -> list[dict]:
+    """
+    Queries every source in parallel and merges the listings of those that answered
+    within their timeout. Raises RuntimeError only when no source produced a result.
+    """
+    sources = sources or active_sources
+    started = time.monotonic()
+    pending = {}  # future -> source
+    signals = {}  # future -> its cancel event
+    hedged, resolved, errors = set(), {}, []
+
+    def _submit(source):
+        # Run in a copy of the caller's context so per-job metrics still apply
+        context = contextvars.copy_context()
+        signal = CancelSignal(parent=cancel_signal.get())
+        context.run(cancel_signal.set, signal)
+        future = _pool.submit(context.run, source.timed_fetch, product, api_key, limiter)
+        pending[future] = source
+        signals[future] = signal
+
+    def _abandon(source):
+        # Requests still running for a resolved source stop before their next attempt or retry
+        for future, other in list(pending.items()):
+            if other is source:
+                future.cancel()
+                signals.pop(future).set()
+                del pending[future]
+
+    for source in sources:
+        _submit(source)
+    while len(resolved) < len(sources):
+        now = time.monotonic() - started
+        # Next moment something has to happen: a hedge to send or a source to give up on
+        deadlines = []
+        for source in sources:
+            if source.name in resolved:
+                continue
+            delay = source.hedge_delay()
+            if delay is not None and source.name not in hedged:
+                deadlines.append(delay)
+            deadlines.append(source.timeout)
+        waiting = [future for future, source in pending.items() if source.name not in resolved]
+        done, _ = wait(waiting, timeout=max(0.0, min(deadlines) - now), return_when=FIRST_COMPLETED)
+        for future in done:
+            if future not in pending:
+                continue
+            source = pending.pop(future)
+            signals.pop(future, None)
+            if source.name in resolved:
+                continue
+            try:
+                resolved[source.name] = future.result()
+                SOURCE_REQUESTS.inc(source=source.name, outcome="ok")
+                _abandon(source)
+            except Exception as e:
+                SOURCE_REQUESTS.inc(source=source.name, outcome="error")
+                if not any(other is source for other in pending.values()):
+                    resolved[source.name] = None
+                    errors.append(f"{source.name}: {e}")
+        now = time.monotonic() - started
+        for source in sources:
+            if source.name in resolved:
+                continue
+            if now >= source.timeout:
+                SOURCE_REQUESTS.inc(source=source.name, outcome="timeout")
+                _abandon(source)
+                resolved[source.name] = None
+                errors.append(f"{source.name}: timed out after {source.timeout:g}s")
+                continue
+            delay = source.hedge_delay()
+            if delay is not None and source.name not in hedged and now >= delay:
+                hedged.add(source.name)
+                SOURCE_REQUESTS.inc(source=source.name, outcome="hedged")
+                _submit(source)
+
+    answered = {name: listings for name, listings in resolved.items() if listings is not None}
+    if not answered:
+        raise RuntimeError("; ".join(errors) or "no price sources configured")
+    for error in errors:
+        print(f"[ERROR] Price source {error} (product: {product})")
+    merged = []
+    for source in sources:
+        for listing in answered.get(source.name) or []:
+            listing["source"] = source.name
+            merged.append(listing)
+    return merged
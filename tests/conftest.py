@@ -0,0 +1,69 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import threading
+import tempfile
+import json
+import time
+import sys
+import os
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Stores are opened at import time; keep them out of the working tree and away from real keys
+_workdir = tempfile.mkdtemp(prefix="retail-radar-tests-")
+for name, file_name in (("PRICE_CACHE_PATH", "price_cache.sqlite"), ("SKU_STATE_PATH", "sku_state.sqlite"),
+                        ("PRICE_HISTORY_PATH", "history.sqlite"), ("CHECKPOINT_PATH", "checkpoints.sqlite"),
+                        ("MONITOR_PATH", "monitor.sqlite")):
+    os.environ[name] = os.path.join(_workdir, file_name)
+os.environ["PRICE_SOURCES_FILE"] = ""
+os.environ["SERPAPI_KEY"] = "test"
+
+
+class StubSerpApi:
+    """Local Google Shopping stand-in: two listings per query, errors for queries containing 'missing'/'invalid'."""
+    def __init__(self):
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+                stub.requests.append((time.monotonic(), query))
+                status = 200
+                if "missing" in query:
+                    payload = {"error": "Google Shopping hasn't returned any results for this query."}
+                elif "invalid" in query:
+                    status, payload = 400, {"error": "Invalid query"}
+                else:
+                    payload = {"shopping_results": [
+                        {"title": f"{query} A", "price": "₹1,000.00", "extracted_price": 1000.0, "source": "Store A",
+                         "product_link": "https://example.com/a", "rating": 4.5, "reviews": 120},
+                        {"title": f"{query} B", "price": "₹700.00", "extracted_price": 700.0, "source": "Store B",
+                         "product_link": "https://example.com/b", "second_hand_condition": "refurbished"},
+                    ]}
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def stub_serpapi(monkeypatch):
+    import price_engine
+    stub = StubSerpApi()
+    monkeypatch.setattr(price_engine, "SERPAPI_BACKEND", stub.url)
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from analyst import StubAnalystModel, chunk_verdict, write_sectioned_report
+from events import bus, current_job
+
+
+def _row(listed, market, status):
+    return {"Original Listing Price": listed, "Market Average Price": market, "Status": status,
+            "Average of all ratings": 4.2, "Maximum Number of reviews": 10}
+
+
+VERDICT = {
+    **{f"Samsung Galaxy S{number} 256GB": _row(900 + number, 950, "Underpriced") for number in range(5)},
+    **{f"iPhone {number} 128GB": _row(1200, 1100, "Overpriced") for number in range(12, 15)},
+    "Nokia 3310": _row(50, None, "No Data"),
+}
+
+
+def test_chunk_by_product_keeps_catalog_order():
+    chunks = chunk_verdict(VERDICT, by="product", size=4)
+    assert [title for title, _ in chunks] == ["Products 1-4", "Products 5-8", "Products 9-9"]
+    assert [product for _, rows in chunks for product in rows] == list(VERDICT)
+
+
+def test_chunk_by_category_splits_large_categories():
+    chunks = chunk_verdict(VERDICT, by="category", size=3)
+    assert [title for title, _ in chunks] == ["Samsung (1/2)", "Samsung (2/2)", "Apple", "Nokia"]
+    assert [len(rows) for _, rows in chunks] == [3, 2, 3, 1]
+
+
+def test_unknown_chunk_mode():
+    with pytest.raises(ValueError):
+        chunk_verdict(VERDICT, by="store")
+
+
+class FailingStub(StubAnalystModel):
+    """Fails the section that contains `failing`; later sections answer faster so they finish first."""
+    def __init__(self, failing: str):
+        super().__init__()
+        self.failing = failing
+
+    async def generate(self, instruction, prompt):
+        if self.failing in prompt and '"section"' in prompt:
+            raise RuntimeError("model unavailable")
+        # Earlier sections take longer, so completion order is the reverse of catalog order
+        await asyncio.sleep(0.05 if "Products 1-" in prompt else 0)
+        return await super().generate(instruction, prompt)
+
+
+def test_sections_stream_and_assemble_in_order():
+    async def _run():
+        token = current_job.set("analyst-test")
+        try:
+            return await write_sectioned_report(VERDICT, FailingStub("iPhone 13"), by="product", size=4, workers=2)
+        finally:
+            current_job.reset(token)
+
+    result = asyncio.run(_run())
+    sections = result["sections"]
+    assert [section["title"] for section in sections] == ["Products 1-4", "Products 5-8", "Products 9-9"]
+    assert result["errors"] == 1
+    assert sections[1]["error"] == "model unavailable" and sections[1]["text"] is None
+    assert "Samsung Galaxy S0 256GB: listed at 900 vs market average 950" in sections[0]["text"]
+    assert "Nokia 3310: no usable prices" in sections[2]["text"]
+
+    report = result["report"]
+    assert report.index("## Summary") < report.index("## Products 1-4") < report.index("## Products 5-8")
+    assert "_Section failed: model unavailable_" in report
+    assert result["summary"].startswith("9 products analysed")
+
+    events = [event for event in bus.history("analyst-test") if event["type"] == "report_section"]
+    assert sorted(event["index"] for event in events) == [0, 1, 2]
+    # Each section is emitted when it finishes, not in catalog order
+    assert events[-1]["index"] == 0
+    assert all(event["total"] == 3 for event in events)
+    assert next(event for event in events if event["index"] == 1)["error"] == "model unavailable"
@@ -0,0 +1,51 @@
+import asyncio
+import pytest
+from checkpoint import checkpoints, current_run
+
+
+def test_resumed_fetch_only_requests_missing_products(stub_serpapi):
+    from my_tools import _fetch_checkpointed
+    run_id = "checkpoint-resume"
+    checkpoints.start(run_id, "book.xlsx")
+    token = current_run.set(run_id)
+    try:
+        first = _fetch_checkpointed(["Pixel 9 128GB", "Galaxy S24 256GB", "missing Nokia 3310"], force_refresh=True)
+        assert "error" in first["missing Nokia 3310"]
+        # Errors aren't checkpointed, so a resume retries them
+        assert set(checkpoints.fetched(run_id)) == {"Pixel 9 128GB", "Galaxy S24 256GB"}
+
+        stub_serpapi.requests.clear()
+        seen = []
+        second = _fetch_checkpointed(["Pixel 9 128GB", "Galaxy S24 256GB", "missing Nokia 3310", "Moto G 64GB"],
+                                     force_refresh=True, on_result=lambda product, _: seen.append(product))
+    finally:
+        current_run.reset(token)
+    assert sorted(query for _, query in stub_serpapi.requests) == ["Moto G 64GB", "missing Nokia 3310"]
+    assert list(second) == ["Pixel 9 128GB", "Galaxy S24 256GB", "missing Nokia 3310", "Moto G 64GB"]
+    assert second["Pixel 9 128GB"] == first["Pixel 9 128GB"]
+    # Checkpointed products are still reported to the progress callback
+    assert sorted(seen) == sorted(second)
+    assert checkpoints.get(run_id)["products_fetched"] == 3
+
+
+def test_resume_after_saved_skips_pricing(monkeypatch):
+    pytest.importorskip("google.adk")
+    import agent
+
+    def _no_pricing(*args, **kwargs):
+        raise AssertionError("pricing ran again for a run whose verdict was saved")
+
+    monkeypatch.setattr(agent, "run_market_analysis", _no_pricing)
+    monkeypatch.setattr(agent, "run_sharded_analysis", _no_pricing)
+    monkeypatch.setattr(agent, "PRICING_MODE", "native")
+    monkeypatch.setattr(agent, "ANALYST_MODE", "sections")
+    monkeypatch.setattr(agent, "section_model", agent.StubAnalystModel())
+    monkeypatch.setattr(agent, "load_verdict", lambda run_id: {
+        "Pixel 9 128GB": {"Original Listing Price": 900, "Market Average Price": 950.0, "Status": "Underpriced"}})
+    run_id = "checkpoint-saved"
+    checkpoints.start(run_id, "book.xlsx")
+    checkpoints.set_phase(run_id, "saved", {"status": "Success", "run_id": run_id, "message": "saved"})
+
+    report = asyncio.run(agent.main_async(run_id=run_id, resume=True))
+    assert "Pixel 9 128GB" in report
+    assert checkpoints.get(run_id)["phase"] == "done"
@@ -0,0 +1,20 @@
+import functools
+import json
+import my_tools
+from compact import encode_batch
+from price_engine import price_cache
+
+
+def test_pending_products_are_not_fetched_again_without_cache(stub_serpapi, monkeypatch):
+    monkeypatch.setattr(price_cache, "ttl", 0)
+    # Small enough that only part of the batch fits in one response
+    monkeypatch.setattr(my_tools, "encode_batch", functools.partial(encode_batch, budget=150))
+    products = [f"Widget {number} 64GB" for number in range(6)]
+
+    first = json.loads(my_tools.track_prices(products))
+    assert first["pending"] and first["results"]
+    assert len(stub_serpapi.requests) == 6
+
+    second = json.loads(my_tools.track_prices(first["pending"]))
+    assert len(stub_serpapi.requests) == 6
+    assert set(second["results"]) | set(second.get("pending", [])) == set(first["pending"])
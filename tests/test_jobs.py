@@ -0,0 +1,39 @@
+import asyncio
+import price_engine
+from jobs import CANCELLED, JobManager, run_in_thread
+from resilience import RateLimiter
+
+PRODUCTS = [f"Gadget {number} 32GB" for number in range(20)]
+
+
+def test_cancel_stops_the_pricing_thread_and_keeps_the_job_active(stub_serpapi):
+    # Each request waits ~0.5s for a token, so the thread is mid-wait when the job is cancelled
+    limiter = RateLimiter(2, burst=1)
+
+    async def runner(job):
+        return await run_in_thread(price_engine.fetch_many, PRODUCTS, max_workers=1, limiter=limiter,
+                                   force_refresh=True, dedupe=False)
+
+    async def scenario():
+        manager = JobManager(runner, workers=1)
+        await manager.start()
+        try:
+            job = manager.submit(file_name="book.xlsx")
+            await asyncio.sleep(0.7)
+            manager.cancel(job.id)
+            await asyncio.sleep(0.1)
+            # Until the thread has stopped, the same request is still this job, not a second pipeline
+            assert manager.submit(file_name="book.xlsx") is job
+            while job.status != CANCELLED:
+                await asyncio.sleep(0.02)
+            return job
+        finally:
+            await manager.stop()
+
+    job = asyncio.run(scenario())
+    assert job.cancel_event.is_set()
+    requests = len(stub_serpapi.requests)
+    assert 0 < requests < len(PRODUCTS)
+    # The thread had already stopped when the job was reported cancelled
+    asyncio.run(asyncio.sleep(0.3))
+    assert len(stub_serpapi.requests) == requests
@@ -0,0 +1,24 @@
+from checkpoint import current_run
+from events import current_job
+from metrics import observe_job, registry
+
+
+def test_cli_runs_are_timed_under_their_run_id():
+    token = current_run.set("metrics-cli-run")
+    try:
+        observe_job("tool:run_market_analysis", 1.5)
+        observe_job("tool:run_market_analysis", 0.5)
+    finally:
+        current_run.reset(token)
+    assert registry.job_summary("metrics-cli-run") == {"tool:run_market_analysis": {"calls": 2, "seconds": 2.0}}
+
+
+def test_backend_jobs_are_timed_under_the_job_id():
+    run_token, job_token = current_run.set("metrics-resumed-run"), current_job.set("metrics-job")
+    try:
+        observe_job("agent:analyst", 0.25)
+    finally:
+        current_job.reset(job_token)
+        current_run.reset(run_token)
+    assert registry.job_summary("metrics-job") == {"agent:analyst": {"calls": 1, "seconds": 0.25}}
+    assert registry.job_summary("metrics-resumed-run") == {}
@@ -0,0 +1,19 @@
+import pytest
+from monitor import WatchList
+
+
+@pytest.mark.parametrize("interval", [0, -60, float("nan"), float("inf")])
+def test_watch_rejects_non_positive_intervals(tmp_path, interval):
+    watchlist = WatchList(str(tmp_path / "monitor.sqlite"))
+    with pytest.raises(ValueError):
+        watchlist.watch({"Pixel 9 128GB": 900}, interval)
+    assert watchlist.stats()["watched"] == 0
+
+
+def test_watch_schedules_within_one_interval(tmp_path):
+    watchlist = WatchList(str(tmp_path / "monitor.sqlite"))
+    assert watchlist.watch({"Pixel 9 128GB": 900, "Galaxy S24 256GB": None}, 3600, now=1000.0) == 2
+    stats = watchlist.stats(now=999.0)
+    assert stats["watched"] == 2 and stats["due"] == 0
+    assert stats["requests_per_hour_needed"] == 2.0
+    assert watchlist.stats(now=1000.0 + 3600)["due"] == 2
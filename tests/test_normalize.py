@@ -0,0 +1,43 @@
+import pytest
+from normalize import QueryIndex, canonical_key, group_queries, tokenize
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Dell XPS 13 9340 Laptop Intel Core i7 16GB 512GB SSD", "Dell XPS 13 9340 Laptop Intel Core i5 16GB 512GB SSD"),
+    ("Samsung Galaxy Tab S9 11 inch WiFi Tablet", "Samsung Galaxy Tab S8 11 inch WiFi Tablet"),
+    ("Apple Watch Series 9 GPS 45mm", "Apple Watch Series 9 GPS Cellular 45mm"),
+    ("iPhone 15 Pro 256GB", "iPhone 15 Pro Max 256GB"),
+    ("Google Pixel 8 128GB", "Google Pixel 8 256GB"),
+])
+def test_near_duplicates_stay_apart(first, second):
+    groups = group_queries([first, second])
+    assert groups == {first: [first], second: [second]}
+
+
+@pytest.mark.parametrize("first, second", [
+    ("iPhone 15 128GB Black", "Apple iPhone 15 (128 GB) - Black"),
+    ("Sony WH-1000XM5 Wireless Headphones", "Sony WH1000XM5"),
+    ("One Plus 12 256GB", "OnePlus 12 256 GB"),
+])
+def test_equivalent_queries_share_a_key(first, second):
+    assert canonical_key(first) == canonical_key(second)
+    assert group_queries([first, second]) == {first: [first, second]}
+
+
+def test_fuzzy_merge_only_across_generic_words():
+    groups = group_queries(["Samsung Galaxy Tab S9 11 inch WiFi Tablet", "Samsung Galaxy Tab S9 11 inch WiFi"])
+    assert list(groups.values()) == [["Samsung Galaxy Tab S9 11 inch WiFi Tablet", "Samsung Galaxy Tab S9 11 inch WiFi"]]
+
+
+def test_mixed_letter_digit_tokens_are_specs():
+    words, specs = tokenize("Intel Core i7 Galaxy Tab S9 45mm")
+    assert {"i7", "s9", "45mm"} <= specs
+    assert not {"i7", "s9", "45mm"} & words
+
+
+def test_index_is_bounded():
+    index = QueryIndex(max_queries=3)
+    for number in range(10):
+        index.representative(f"Widget {number}")
+    assert len(index) <= 3
+    assert index.representative("Widget 9") == "Widget 9"
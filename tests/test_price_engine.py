@@ -0,0 +1,31 @@
+import price_engine
+from resilience import RateLimiter
+
+
+def test_fetch_many_parses_listings(stub_serpapi):
+    results = price_engine.fetch_many(["Pixel 9 128GB", "Galaxy S24 256GB"], limiter=RateLimiter(0), force_refresh=True)
+    assert list(results) == ["Pixel 9 128GB", "Galaxy S24 256GB"]
+    first = results["Pixel 9 128GB"]
+    assert [listing["price_numeric"] for listing in first] == [1000.0, 700.0]
+    assert first[0]["store"] == "Store A" and first[0]["rating"] == 4.5 and first[0]["reviews"] == 120
+    assert first[1]["condition"] == "refurbished"
+    assert first[0]["source"] == "serpapi"
+
+
+def test_fetch_many_applies_rate_limit(stub_serpapi):
+    products = [f"Widget {number} 64GB" for number in range(6)]
+    price_engine.fetch_many(products, max_workers=6, limiter=RateLimiter(10, burst=1), force_refresh=True)
+    times = sorted(at for at, _ in stub_serpapi.requests)
+    assert len(times) == 6
+    # One token at the start, then one every 0.1s
+    assert times[-1] - times[0] >= 0.4
+
+
+def test_fetch_many_returns_error_results(stub_serpapi):
+    results = price_engine.fetch_many(["missing thing", "invalid thing", "Pixel 9 128GB"],
+                                      limiter=RateLimiter(0), force_refresh=True)
+    assert "error" in results["missing thing"]
+    assert "error" in results["invalid thing"]
+    assert isinstance(results["Pixel 9 128GB"], list)
+    # Bad queries aren't retried
+    assert [query for _, query in stub_serpapi.requests].count("invalid thing") == 1
@@ -0,0 +1,82 @@
+import pytest
+from pricing import compute_market_stats, is_comparable, parse_price, price_status
+
+
+def _listing(price, condition="new", title="Phone", reviews=0, rating=None):
+    return {"product_name": title, "price_numeric": price, "condition": condition, "reviews": reviews, "rating": rating}
+
+
+def _by_product(rows):
+    return {row["Product Name"]: row for row in rows}
+
+
+def test_iqr_drops_the_outlier():
+    listings = {"Phone": [_listing(100, reviews=5, rating=4.0), _listing(102), _listing(104),
+                          _listing(106, reviews=40, rating=5.0), _listing(1000, reviews=900)]}
+    row = compute_market_stats({"Phone": 110}, listings)[0]
+    assert row["Listings Used"] == 4
+    assert row["Market Average Price"] == 103.0
+    assert row["Market Median Price"] == 103.0
+    assert (row["Market Min Price"], row["Market Max Price"]) == (100.0, 106.0)
+    # The outlier's reviews don't count either
+    assert row["Maximum Number of reviews"] == 40
+    assert row["Average of all ratings"] == 4.5
+    assert row["Status"] == "Overpriced"
+
+
+def test_mad_with_zero_deviation_keeps_only_the_agreeing_prices():
+    listings = {"Phone": [_listing(200), _listing(200), _listing(200), _listing(250)]}
+    row = compute_market_stats({"Phone": 200}, listings, method="mad")[0]
+    assert row["Listings Used"] == 3
+    assert row["Market Average Price"] == 200.0
+    assert row["Status"] == "At Market"
+
+
+def test_refurbished_and_used_listings_are_excluded():
+    listings = {"Phone": [_listing(500), _listing(520),
+                          _listing(300, condition="refurbished"),
+                          _listing(250, condition="used"),
+                          _listing(280, title="Phone (Renewed)"),
+                          _listing(290, title="Phone pre-owned")]}
+    row = compute_market_stats({"Phone": 400}, listings)[0]
+    assert row["Listings Used"] == 2
+    assert row["Market Average Price"] == 510.0
+    assert row["Status"] == "Underpriced"
+    # Whole words only: "Useful" is not "used"
+    assert is_comparable({"product_name": "Useful Phone Stand", "condition": "new"})
+
+
+def test_products_without_listings_or_with_errors_have_no_market_data():
+    inventory = {"Empty": "₹1,299", "Failed": 900, "Phone": 100}
+    listings = {"Empty": [], "Failed": {"error": "Price lookup failed"}, "Phone": [_listing(100)]}
+    rows = _by_product(compute_market_stats(inventory, listings))
+    assert list(rows) == ["Empty", "Failed", "Phone"]
+    for name in ("Empty", "Failed"):
+        row = rows[name]
+        assert row["Market Average Price"] is None and row["Market Median Price"] is None
+        assert row["Listings Used"] == 0 and row["Maximum Number of reviews"] == 0
+        assert row["Status"] == "No Market Data"
+    assert rows["Empty"]["Original Listing Price"] == 1299.0
+    assert rows["Phone"]["Status"] == "At Market"
+
+
+def test_unknown_outlier_method_is_rejected():
+    with pytest.raises(ValueError):
+        compute_market_stats({"Phone": 1}, {"Phone": []}, method="zscore")
+
+
+@pytest.mark.parametrize("listing_price, market_average, status", [
+    (120, 100.0, "Overpriced"),
+    (80, 100.0, "Underpriced"),
+    (100, 100.0, "At Market"),
+    (None, 100.0, "Unknown"),
+    (100, None, "No Market Data"),
+    (None, None, "No Market Data"),
+])
+def test_price_status(listing_price, market_average, status):
+    assert price_status(listing_price, market_average) == status
+
+
+def test_parse_price():
+    assert parse_price("₹1,299.50") == 1299.5
+    assert parse_price(True) is None and parse_price("n/a") is None
@@ -0,0 +1,67 @@
+import csv
+import json
+import openpyxl
+import reports
+from reports import write_report
+
+ROWS = [
+    {"Product Name": "Pixel 9 128GB", "Original Listing Price": 900, "Market Average Price": 950.5, "Status": "Underpriced"},
+    {"Product Name": "Nothing found", "Original Listing Price": 500, "Market Average Price": float("nan"),
+     "Market Max Price": float("inf"), "Status": "No Data"},
+]
+
+
+def test_nan_becomes_empty_cell_and_null(tmp_path):
+    base = str(tmp_path / "verdict")
+    paths = write_report(ROWS, base, formats=["xlsx", "csv", "jsonl"])
+    assert paths == [f"{base}.xlsx", f"{base}.csv", f"{base}.jsonl"]
+
+    sheet = openpyxl.load_workbook(f"{base}.xlsx").active
+    values = list(sheet.iter_rows(values_only=True))
+    assert values[0][:4] == ("Product Name", "Original Listing Price", "Market Average Price", "Status")
+    assert values[1][2] == 950.5
+    assert values[2][2] is None and values[2][4] is None
+
+    with open(f"{base}.jsonl", encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert lines[1]["Market Average Price"] is None and lines[1]["Market Max Price"] is None
+    with open(f"{base}.jsonl", encoding="utf-8") as f:
+        assert "NaN" not in f.read()
+
+    with open(f"{base}.csv", encoding="utf-8", newline="") as f:
+        assert list(csv.reader(f))[2][2] == ""
+
+
+def test_rows_past_the_sheet_limit_spill_over(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(reports, "EXCEL_MAX_ROWS", 5)
+    rows = [{"Product Name": f"Widget {number}", "Price": number} for number in range(10)]
+    write_report(rows, str(tmp_path / "verdict"), formats=["xlsx"])
+    workbook = openpyxl.load_workbook(tmp_path / "verdict.xlsx")
+    assert workbook.sheetnames == ["Verdict", "Verdict (2)", "Verdict (3)"]
+    written = [row[0] for sheet in workbook for row in sheet.iter_rows(min_row=2, values_only=True)]
+    assert written == [row["Product Name"] for row in rows]
+    assert "exceed Excel's sheet limit" in capsys.readouterr().out
+
+
+def test_runs_saved_in_the_same_second_get_their_own_files(tmp_path, monkeypatch):
+    import datetime
+    import my_tools
+    from checkpoint import current_run
+
+    class FrozenClock(datetime.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls(2025, 1, 1, 12, 0, 0)
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(my_tools, "datetime", FrozenClock)
+    monkeypatch.setattr(my_tools, "VERDICT_FORMATS", ["csv"])
+    names = []
+    for run_id in ("run-a", "run-b"):
+        token = current_run.set(run_id)
+        try:
+            assert my_tools.save_rows(ROWS[:1])["status"] == "Success"
+        finally:
+            current_run.reset(token)
+        names.append(sorted(path.name for path in (tmp_path / "verdict").iterdir()))
+    assert names[-1] == ["final_market_analysis_20250101_120000_run-a.csv", "final_market_analysis_20250101_120000_run-b.csv"]
@@ -0,0 +1,41 @@
+from events import bus, current_job
+import threading
+import pytest
+from resilience import AdaptiveRateLimiter, CallCancelled, CircuitBreaker, RateLimiter, Upstream, cancel_signal
+
+
+def test_breaker_transitions_are_events_not_stdout(capsys):
+    token = current_job.set("resilience-test")
+    try:
+        breaker = CircuitBreaker("stub", failure_threshold=2, reset_timeout=0)
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state != "closed"
+        breaker.before()
+        breaker.record_success()
+        limiter = AdaptiveRateLimiter("stub", 4)
+        limiter.on_throttle()
+    finally:
+        current_job.reset(token)
+    events = [(event["state"], event["upstream"]) for event in bus.history("resilience-test") if event["type"] == "resilience"]
+    assert events == [("circuit_open", "stub"), ("circuit_closed", "stub"), ("throttled", "stub")]
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert "circuit opened" in captured.err
+
+
+def test_cancelled_half_open_probe_frees_the_slot():
+    upstream = Upstream("stub", RateLimiter(1000), breaker=CircuitBreaker("stub", failure_threshold=1, reset_timeout=0))
+    upstream.breaker.record_failure()
+    assert upstream.breaker.state == "half_open"
+    cancelled = threading.Event()
+    cancelled.set()
+    token = cancel_signal.set(cancelled)
+    try:
+        with pytest.raises(CallCancelled):
+            upstream.call(lambda: "never")
+    finally:
+        cancel_signal.reset(token)
+    # The probe never ran, so the next call gets to probe and closes the circuit
+    assert upstream.call(lambda: "ok") == "ok"
+    assert upstream.breaker.state == "closed"
@@ -0,0 +1,27 @@
+import time
+from price_engine import build_params, fetched_times
+from price_cache import PriceCache
+from sku_state import SkuStateStore, plan_refresh
+
+
+def test_cached_listings_keep_their_fetch_time(tmp_path):
+    cache = PriceCache(str(tmp_path / "cache.sqlite"), ttl=6 * 3600)
+    params = build_params("Pixel 9 128GB")
+    params["sources"] = ""
+    cache.set(params, [{"price_numeric": 100.0}])
+    conn = cache._connect()
+    conn.execute("UPDATE results SET created_at = created_at - 5000")
+    conn.commit()
+
+    times = fetched_times(["Pixel 9 128GB", "Galaxy S24 256GB"], cache)
+    assert set(times) == {"Pixel 9 128GB"}
+
+    store = SkuStateStore(str(tmp_path / "state.sqlite"))
+    inventory = {"Pixel 9 128GB": 900, "Galaxy S24 256GB": 800}
+    store.save(inventory, [{"Product Name": product, "Listings Used": 3} for product in inventory], times)
+    states = store.load(list(inventory))
+    assert time.time() - states["Pixel 9 128GB"]["fetched_at"] > 4900
+    assert time.time() - states["Galaxy S24 256GB"]["fetched_at"] < 60
+
+    changed, stale, reusable = plan_refresh(inventory, states, max_age=3600)
+    assert stale == ["Pixel 9 128GB"] and list(reusable) == ["Galaxy S24 256GB"] and not changed
@@ -0,0 +1,60 @@
+import time
+from resilience import Upstream, RateLimiter, RetryPolicy, CircuitBreaker, UpstreamError, cancel_signal
+from sources import PriceSource, SerpApiSource, fetch_from_sources
+
+
+def test_serpapi_is_not_hedged_by_default():
+    assert SerpApiSource().hedge_delay() is None
+    assert SerpApiSource(hedge=True, hedge_after=1.0).hedge_delay() == 1.0
+
+
+class FlakySource(PriceSource):
+    """Fails with a retryable error through an Upstream until cancelled, counting its attempts."""
+    def __init__(self, name, **options):
+        super().__init__(name, **options)
+        self.attempts = 0
+        self.upstream = Upstream(name, RateLimiter(0), RetryPolicy(attempts=50, base_delay=0.05, max_delay=0.05,
+                                                                   budget=30), CircuitBreaker(name, 1000))
+
+    def fetch(self, product, api_key=None, limiter=None):
+        def _attempt():
+            self.attempts += 1
+            raise UpstreamError("unavailable", status=503)
+        return self.upstream.call(_attempt)
+
+
+class QuickSource(PriceSource):
+    def fetch(self, product, api_key=None, limiter=None):
+        return [{"product_name": product, "price_numeric": 10.0}]
+
+
+def test_timed_out_source_stops_retrying():
+    flaky = FlakySource("flaky", timeout=0.3, hedge=False)
+    listings = fetch_from_sources("Pixel 9", sources=[QuickSource("quick", hedge=False), flaky])
+    assert [listing["source"] for listing in listings] == ["quick"]
+    time.sleep(0.2)
+    attempts = flaky.attempts
+    time.sleep(0.3)
+    # No further retries once the caller gave up on the source
+    assert flaky.attempts == attempts
+
+
+def test_losing_hedge_is_cancelled():
+    calls = []
+
+    class SlowFirst(PriceSource):
+        def fetch(self, product, api_key=None, limiter=None):
+            signal = cancel_signal.get()
+            calls.append(signal)
+            if len(calls) == 1:
+                signal.wait(2)
+                return [{"product_name": "late"}]
+            return [{"product_name": "hedge"}]
+
+    source = SlowFirst("slow", hedge_after=0.1, timeout=5)
+    started = time.monotonic()
+    listings = fetch_from_sources("Pixel 9", sources=[source])
+    assert [listing["product_name"] for listing in listings] == ["hedge"]
+    assert time.monotonic() - started < 1
+    assert len(calls) == 2
+    assert calls[0].is_set() and calls[0] is not calls[1]